@@ -0,0 +1,40 @@
+import json
+import os
+import urllib.request
+
+# Client of api_server.py with the interface of the agent's turn functions, so app.py can
+# leave the advisor loop, the embedding model and the OpenAI client to the API service:
+#
+#   ADVISOR_API_URL=http://127.0.0.1:8000 streamlit run app.py
+
+ADVISOR_API_URL = os.environ.get("ADVISOR_API_URL", "")
+TIMEOUT_SECONDS = 120
+
+def post(path, payload, base_url=None):
+    request = urllib.request.Request((base_url or ADVISOR_API_URL).rstrip('/') + path,
+                                     data=json.dumps(payload).encode('utf-8'),
+                                     headers={"Content-Type": "application/json"})
+    return urllib.request.urlopen(request, timeout=TIMEOUT_SECONDS)
+
+def chat_request(messages, labels, year, use_cache, stream):
+    return {"messages": messages, "highlights": dict(labels.data), "year": year, "use_cache": use_cache, "stream": stream}
+
+def apply_result(messages, labels, result):
+    messages.extend(result["messages"])
+    labels.data = result["highlights"]
+
+def add_assistant_response(messages, labels, use_cache=True, year=None):
+    with post("/chat", chat_request(messages, labels, year, use_cache, False)) as response:
+        apply_result(messages, labels, json.load(response))
+
+def stream_assistant_response(messages, labels, use_cache=True, year=None):
+    # Generator of the reply text, for st.write_stream
+    with post("/chat", chat_request(messages, labels, year, use_cache, True)) as response:
+        for line in response:
+            event = json.loads(line)
+            if "error" in event:
+                raise RuntimeError(event["error"])
+            if event.get("done"):
+                apply_result(messages, labels, event)
+                return
+            yield event["delta"]
@@ -0,0 +1,21 @@
+from learning_objectives import LEARNING_OBJECTIVES
+
+# The advisor's system prompt and opening message, shared by the Streamlit app and the API service
+
+SYSTEM_PROMPT = "EM.411, EM.412, and EM.413 are System Design and Management (SDM) Core subjects. The learning objectives (lo) of SDM are " + "\n".join([f"{key}: {value}" for key, value in LEARNING_OBJECTIVES.items()]) + ''' 
+    You are an academic advisor, helping SDM students explore subjects provided by MIT. Don't make assumptions about what values to plug into functions. Ask for clarification if a user request is ambiguous. Always include both subject id and subject title such as 'EM.411 Foundations of System Design and Management' when referring to a subject. Highlight the related subjects in the graph.
+    Be concise and straight to the point when you response.
+    '''
+GREETING = "how can I help you today?"
+
+def initial_messages():
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "assistant", "content": GREETING},
+    ]
+
+def with_system_prompt(messages):
+    # messages, preceded by the advisor's system prompt if they don't start with one
+    if messages and isinstance(messages[0], dict) and messages[0].get("role") == "system":
+        return list(messages)
+    return [{"role": "system", "content": SYSTEM_PROMPT}] + list(messages)
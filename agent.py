@@ -1,36 +1,101 @@
 import json
+import os
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
 import numpy as np
-import streamlit as st
-from bokeh.plotting import ColumnDataSource
 from openai import OpenAI
+from openai.types.chat import ChatCompletionMessageToolCall
+from openai.types.chat.chat_completion_message_tool_call import Function
 from tenacity import retry, wait_random_exponential, stop_after_attempt
 from termcolor import colored
-from sklearn.metrics.pairwise import cosine_similarity
 
-from create_embeddings import create_embeddings
-from load_embeddings import get_raw_embeddings_from_file  
+from context_manager import ContextManager
+from embedding_model import embed_queries, embed_query, query_cache, warm_up_model
+from learning_objectives import LEARNING_OBJECTIVES
+from lexical_index import parse_subject_ids
+from load_embeddings import get_catalog_registry
+from response_cache import ResponseCache, content_version
+from tracing import span, stage, submit_in_context
 
 GPT_MODEL = "gpt-4o"
+# Upper bound on model -> tools -> model rounds in one user turn
+MAX_TOOL_ROUNDS = 5
+def openai_api_key():
+    # OPENAI_API_KEY (e.g. for the local mock server, with OPENAI_BASE_URL) takes precedence over the Streamlit secret.
+    # Streamlit is only imported for the secret, so the API server runs without it when the variable is set.
+    key = os.environ.get("OPENAI_API_KEY")
+    if key:
+        return key
+    import streamlit as st
+    return st.secrets["openai_key"]
+
+def session_labels():
+    # The label source of the current Streamlit session, for calls from the app
+    import streamlit as st
+    return st.session_state.get("labels")
+
 client = OpenAI(
-    api_key=st.secrets["openai_key"]
+    api_key=openai_api_key()
 )
 
-subject_ids, subject_embeddings, subject_titles, subject_description, x, y = get_raw_embeddings_from_file("full_embeddings.json")
+# Catalog years shared by all sessions; the default year is loaded now, the others in the background
+catalog_registry = get_catalog_registry()
+catalog_registry.get()
 threshold = 0.42
 
-def highlight_subjects(subject_ids):
+# The catalog state of the current turn, so tools running on the pool use the same year
+# and version even if a rebuilt catalog is swapped in mid-turn
+_active_catalog = ContextVar('active_catalog', default=None)
+
+def active_catalog():
+    state = _active_catalog.get()
+    return state if state is not None else catalog_registry.get()
+
+@contextmanager
+def use_catalog(year=None):
+    token = _active_catalog.set(catalog_registry.get(year))
+    try:
+        yield _active_catalog.get()
+    finally:
+        try:
+            _active_catalog.reset(token)
+        except ValueError:
+            # A generator closed from another context
+            pass
+
+# Trims what is sent to the model to a token budget; the session history keeps everything
+context_manager = ContextManager()
+
+# Answers to standalone questions, shared by all sessions and persisted to disk
+response_cache = ResponseCache()
+
+# Shared by all sessions, runs the independent tool calls of an assistant message concurrently
+tool_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="agent-tool")
+
+# Load the embedding model in the background so the first search doesn't pay for it
+warm_up_model()
+threading.Thread(target=catalog_registry.warm_up, name="catalog-warmup", daemon=True).start()
+
+def highlight_subjects(subject_ids, labels=None):
+    # labels defaults to the current Streamlit session's label source
+    if labels is None:
+        labels = session_labels()
     print("highlighting subjects: ",subject_ids)
-    print("labels: ",st.session_state.labels)
-    not_found = [id for id in subject_ids if id.upper() not in subject_titles]
-    new_data = dict(x=[], y=[], t=[], ind=[])
-    for id in subject_ids:
-        if(id.upper() in subject_titles):
-            new_data['x'].append(x[id.upper()])
-            new_data['y'].append(y[id.upper()])
-            new_data['t'].append(id.upper() + ' ' + subject_titles[id.upper()])
-            new_data['ind'].append(id.upper())
-    st.session_state.labels.data = new_data
+    print("labels: ",labels)
+    catalog = active_catalog().catalog
+    rows = [catalog.row(id) for id in subject_ids]
+    not_found = [id for id, row in zip(subject_ids, rows) if row is None]
+    rows = [row for row in rows if row is not None]
+    new_data = dict(
+        x=catalog.x[rows].tolist(),
+        y=catalog.y[rows].tolist(),
+        t=[catalog.label(row) for row in rows],
+        ind=[catalog.ids[row].upper() for row in rows],
+    )
+    labels.data = new_data
     if not_found:
         return f"Subjects {not_found} not found. Other subjects are hightlighted in the graph"
     else:
@@ -38,62 +103,209 @@ def highlight_subjects(subject_ids):
 
 def get_subject_info(subject_ids):
     print("getting subject info: ",subject_ids)
+    catalog = active_catalog().catalog
     subject_info = []
     for id in subject_ids:
-        if id not in subject_titles:
+        row = catalog.row(id)
+        if row is None:
             subject_info.append(f"Subject {id} not found")
         else:
-            subject_info.append(f"Title: {id} {subject_titles[id]}. Description: {subject_description[id]}")
+            subject_info.append(catalog.info(row))
     return "\n".join(subject_info)
 
-def find_related_subjects(query, top_n = 10):
-    
-    # create embeddings for the query
-    print("creating embeddings for query: ",query)
-    start_time = time.time()
-    query_embedding = create_embeddings([query])[0]
-    end_time = time.time()
-    elapsed_time = end_time - start_time
-    print(f"Embedding creation completed in {elapsed_time} seconds")
-    
-    # Calculate cosine similarity between the query and each subject
-    similarities = cosine_similarity(subject_embeddings, query_embedding.reshape(1, -1))
+def find_similar_subjects(subject_id, top_n = 10):
+    # Neighbours of a subject from the precomputed graph: no encode, no scan
+    print("finding subjects similar to: ",subject_id)
+    state = active_catalog()
+    catalog = state.catalog
+    row = catalog.row(subject_id)
+    if row is None:
+        return f"Subject {subject_id} not found"
+    with span("search", method="knn" if state.knn_graph is not None else "embedding") as s:
+        if state.knn_graph is None:
+            rows, _ = state.search_engine.search_rows(catalog.matrix[row], top_n=top_n + 1)
+            rows = [r for r in catalog.search_rows[rows] if r != row]
+        else:
+            neighbors, _ = state.knn_graph.neighbors_of(row)
+            # Skip rows left out of search, i.e. repeated titles
+            rows = [r for r in neighbors if state.searchable[r]]
+        s.set(hits=min(len(rows), top_n))
+    return "\n".join(catalog.info(r) for r in rows[:top_n])
 
-    # Flatten the similarities array for easier handling
-    similarities = similarities.flatten()
+def find_subjects_for_objectives(objective_codes, top_n = 5):
+    # Precomputed objective x subject scores: no encode, no scan
+    print("finding subjects for objectives: ",objective_codes)
+    state = active_catalog()
+    catalog = state.catalog
+    objectives = state.objectives()
+    results = []
+    for code in objective_codes:
+        top = objectives.top_rows(code, top_n, mask=state.searchable)
+        if top is None:
+            results.append(f"Learning objective {code} not found")
+            continue
+        rows, scores = top
+        code = objectives.codes[objectives.objective_row(code)]
+        results.append(f"{code} {LEARNING_OBJECTIVES[code]}\n" +
+                       "\n".join(f"- {catalog.label(row)} (relevance {score:.2f})" for row, score in zip(rows, scores)))
+    return "\n".join(results)
 
-    # Filter subjects based on the threshold
-    related_subjects = [(subject_ids[idx], similarities[idx]) for idx in range(len(similarities)) if similarities[idx] >= threshold]
+def get_objective_coverage(subject_ids):
+    # How well a set of subjects covers each learning objective, from the precomputed scores
+    print("getting objective coverage: ",subject_ids)
+    state = active_catalog()
+    catalog = state.catalog
+    objectives = state.objectives()
+    rows = [catalog.row(id) for id in subject_ids]
+    not_found = [id for id, row in zip(subject_ids, rows) if row is None]
+    best_rows, best_scores, covered = objectives.coverage([row for row in rows if row is not None])
+    lines = [f"{int(covered.sum())} of {len(objectives.codes)} learning objectives covered"]
+    for code, row, score, is_covered in zip(objectives.codes, best_rows, best_scores, covered):
+        best = f"best {catalog.label(row)} (relevance {score:.2f})" if row >= 0 else "no subjects"
+        lines.append(f"{code}: {'covered' if is_covered else 'not covered'}, {best}")
+    if not_found:
+        lines.append(f"Subjects {not_found} not found")
+    return "\n".join(lines)
 
-    # Sort the results by similarity score in descending order
-    related_subjects.sort(key=lambda x: x[1], reverse=True)
+def get_catalog_changes(from_year, to_year, subject_ids=None):
+    # Precomputed per pair of catalog versions, no search involved
+    print("getting catalog changes: ",from_year, to_year, subject_ids)
+    try:
+        diff = catalog_registry.diff(from_year, to_year)
+    except (KeyError, OSError, ValueError) as e:
+        return f"Error: {e}"
+    if subject_ids:
+        return "\n".join(diff.describe(id) for id in subject_ids)
+    return diff.summary()
 
-    subject_info = []
-    for subject_id, similarity in related_subjects[:top_n]:
-        subject_title = subject_titles[subject_id]
-        subject_desc = subject_description[subject_id]
-        subject_info.append(f"Title: {subject_id} {subject_title}. Description: {subject_desc}")
+def find_related_subjects(query, top_n = 10, nprobe = None):
+    return find_related_subjects_batch([query], top_n, nprobe)[0]
+
+def find_related_subjects_batch(queries, top_n = 10, nprobe = None):
+    state = active_catalog()
+    catalog = state.catalog
+    results = [None] * len(queries)
+
+    # Queries that are only subject ids are exact lookups, no embedding needed
+    semantic = []
+    for i, query in enumerate(queries):
+        requested_ids = parse_subject_ids(query)
+        if any(id in catalog for id in requested_ids):
+            results[i] = get_subject_info(requested_ids)
+        else:
+            semantic.append(i)
+    if not semantic:
+        return results
+    semantic_queries = [queries[i] for i in semantic]
+    
+    # create embeddings for all queries in one encode call
+    print("creating embeddings for queries: ",semantic_queries)
+    with span("encode", queries=len(semantic_queries), query_chars=sum(len(query) for query in semantic_queries)) as s:
+        hits_before = query_cache.stats()["hits"]
+        query_embeddings = np.stack(embed_queries(semantic_queries))
+        cache_stats = query_cache.stats()
+        s.set(cache_hits=cache_stats["hits"] - hits_before, cache_size=cache_stats["size"])
+    
+    # Top subjects by cosine similarity boosted by BM25 keyword matches, filtered by the threshold
+    with span("search", method="hybrid", queries=len(semantic_queries), top_n=top_n) as s:
+        lexical_scores = [state.lexical_index.scores(query) for query in semantic_queries]
+        matches = state.search_engine.hybrid_search_rows_batch(query_embeddings, lexical_scores, top_n=top_n,
+                                                         threshold=threshold, nprobe=nprobe)
+        s.set(hits=sum(len(rows) for rows, _ in matches),
+              lexical_hits=sum(int(np.count_nonzero(scores)) for scores in lexical_scores))
 
-    result = "\n".join(subject_info)
+    for i, (rows, similarities) in zip(semantic, matches):
+        subject_info = [catalog.info(row) for row in catalog.search_rows[rows]]
+        results[i] = "\n".join(subject_info)
 
-    return result
+    return results
 
-@retry(wait=wait_random_exponential(multiplier=1, max=40), stop=stop_after_attempt(3))
+@retry(wait=wait_random_exponential(multiplier=1, max=40), stop=stop_after_attempt(3), reraise=True)
 def chat_completion_request(messages, tools=None, tool_choice=None, model=GPT_MODEL):
     try:
-        response = client.chat.completions.create(
+        return client.chat.completions.create(
             model=model,
             messages=messages,
             tools=tools,
             tool_choice=tool_choice,
         )
-        return response
     except Exception as e:
         print("Unable to generate ChatCompletion response")
         print(f"Exception: {e}")
-        return e
+        raise
 
 tools = [
+    {
+        "type": "function",
+        "function": {
+            "name": "find_subjects_for_objectives",
+            "description": "Get the subjects most relevant to one or more SDM learning objectives, by objective code such as lo.SA01",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "objective_codes": {
+                        "type": "array",
+                        "items": {
+                            "type": "string",
+                            "description": "learning objective code",
+                        },
+                        "description": "learning objective codes such as lo.SA01 or lo.PM05",
+                    },
+                },
+                "required": ["objective_codes"],
+            },
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_objective_coverage",
+            "description": "Get which SDM learning objectives a set of subjects covers, with the best matching subject for each objective",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "subject_ids": {
+                        "type": "array",
+                        "items": {
+                            "type": "string",
+                            "description": "subject id",
+                        },
+                        "description": "subject ids, e.g. the subjects a student took or plans to take",
+                    },
+                },
+                "required": ["subject_ids"],
+            },
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_catalog_changes",
+            "description": "Get the subjects added, removed or changed between two catalog years, or what changed for specific subjects. Available years: " + ", ".join(catalog_registry.years),
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "from_year": {
+                        "type": "string",
+                        "description": "earlier catalog year such as 2024",
+                    },
+                    "to_year": {
+                        "type": "string",
+                        "description": "later catalog year such as 2025",
+                    },
+                    "subject_ids": {
+                        "type": "array",
+                        "items": {
+                            "type": "string",
+                            "description": "subject id",
+                        },
+                        "description": "optional subject ids to report on instead of the overall changes",
+                    },
+                },
+                "required": ["from_year", "to_year"],
+            },
+        }
+    },
     {
         "type": "function",
         "function": {
@@ -111,6 +323,23 @@ tools = [
             },
         }        
     },
+    {
+        "type": "function",
+        "function": {
+            "name": "find_similar_subjects",
+            "description": "Get the list of subjects most similar to a given subject, e.g. one the student already took or liked",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "subject_id": {
+                        "type": "string",
+                        "description": "subject id such as 16.332 or IDS.332",
+                    },
+                },
+                "required": ["subject_id"],
+            },
+        }
+    },
     {
         "type": "function",
         "function": {
@@ -155,63 +384,320 @@ tools = [
     },
 ]
 
-def add_assistant_response(messages):        
-    chat_response = chat_completion_request(
-        messages, tools=tools, model=GPT_MODEL
-    )    
+TOOL_FUNCTIONS = {
+    'find_related_subjects': find_related_subjects,
+    'find_similar_subjects': find_similar_subjects,
+    'get_subject_info': get_subject_info,
+    'highlight_subjects': highlight_subjects,
+    'get_catalog_changes': get_catalog_changes,
+    'find_subjects_for_objectives': find_subjects_for_objectives,
+    'get_objective_coverage': get_objective_coverage,
+}
+TOOL_PARAMETERS = {tool["function"]["name"]: tool["function"]["parameters"] for tool in tools}
 
-    assistant_message = chat_response.choices[0].message
-    print("assistant_message: ",assistant_message)
+def parse_tool_arguments(tool_call):
+    # Keyword arguments for the tool, or None if they are not valid JSON or miss a required parameter
+    try:
+        arguments = json.loads(tool_call.function.arguments or "{}")
+    except json.JSONDecodeError:
+        return None
+    parameters = TOOL_PARAMETERS.get(tool_call.function.name)
+    if not isinstance(arguments, dict) or parameters is None:
+        return None
+    if any(name not in arguments for name in parameters["required"]):
+        return None
+    return {name: value for name, value in arguments.items() if name in parameters["properties"]}
 
-    tool_calls = assistant_message.tool_calls
-    if tool_calls:
-        messages.append(assistant_message)
-        for tool_call in tool_calls:                        
-            # If true the model will return the name of the tool / function to call and the argument(s)  
-            tool_call_id = tool_call.id
-            tool_function_name = tool_call.function.name        
-            
-            # Step 3: Call the function and retrieve results. Append the results to the messages list.      
-            if tool_function_name == 'find_related_subjects':
-                tool_query_string = eval(tool_call.function.arguments)['query']
-                results = find_related_subjects(tool_query_string)
-                
-                messages.append({
-                    "role":"tool", 
-                    "tool_call_id":tool_call_id, 
-                    "name": tool_function_name, 
-                    "content":results
-                })                
-            elif tool_function_name == 'get_subject_info':
-                subject_ids = eval(tool_call.function.arguments)['subject_ids']
-                results = get_subject_info(subject_ids)
-                messages.append({
-                    "role":"tool", 
-                    "tool_call_id":tool_call_id, 
-                    "name": tool_function_name, 
-                    "content":results
-                })
-            elif tool_function_name == 'highlight_subjects':
-                subject_ids = eval(tool_call.function.arguments)['subject_ids']
-                results = highlight_subjects(subject_ids)
-                messages.append({
-                    "role":"tool", 
-                    "tool_call_id":tool_call_id, 
-                    "name": tool_function_name, 
-                    "content":results
-                })
+def tool_message(tool_call, content):
+    return {
+        "role":"tool", 
+        "tool_call_id":tool_call.id, 
+        "name": tool_call.function.name, 
+        "content":content
+    }
+
+def run_tool(tool_function_name, arguments):
+    with span("tool", tool=tool_function_name) as s:
+        try:
+            result = TOOL_FUNCTIONS[tool_function_name](**arguments)
+        except Exception as e:
+            print(f"Tool {tool_function_name} failed: {e}")
+            result = f"Error: {e}"
+        s.set(result_chars=len(str(result)), failed=str(result).startswith("Error:"))
+        return result
+
+def run_search_batch(queries):
+    with span("tool", tool="find_related_subjects", queries=len(queries)) as s:
+        try:
+            results = find_related_subjects_batch(queries)
+        except Exception as e:
+            print(f"Tool find_related_subjects failed: {e}")
+            results = [f"Error: {e}"] * len(queries)
+        s.set(result_chars=sum(len(result) for result in results))
+        return results
+
+class ToolCallRunner:
+    # Starts tool calls as they become known and collects their results in call order.
+    # Independent tools run concurrently on the tool pool. Searches are held back and all
+    # searches of the message share one batched call, sent by flush_searches() or at the
+    # latest by finish(); the calls of one message never depend on each other's results.
+    # Highlighting stays on the calling thread because it writes to the Streamlit session state.
+    def __init__(self, labels=None):
+        self.labels = labels
+        self.results = {}
+        self.futures = {}
+        self.local_calls = []
+        self.pending_searches = []
+
+    def start(self, tool_call):
+        tool_function_name = tool_call.function.name
+        arguments = parse_tool_arguments(tool_call)
+        if tool_function_name not in TOOL_FUNCTIONS:
+            self.results[tool_call.id] = "Error: function does not exist"
+        elif arguments is None:
+            self.results[tool_call.id] = "Error: invalid function arguments"
+        elif tool_function_name == 'find_related_subjects':
+            self.pending_searches.append((tool_call.id, arguments['query']))
+            return
+        elif tool_function_name == 'highlight_subjects':
+            self.local_calls.append((tool_call.id, tool_function_name, arguments))
+        else:
+            self.futures[tool_call.id] = submit_in_context(tool_executor, run_tool, tool_function_name, arguments)
+
+    def flush_searches(self):
+        if not self.pending_searches:
+            return
+        call_ids, queries = zip(*self.pending_searches)
+        self.pending_searches = []
+        future = submit_in_context(tool_executor, run_search_batch, list(queries))
+        for i, call_id in enumerate(call_ids):
+            self.futures[call_id] = (future, i)
+
+    def finish(self, tool_calls):
+        self.flush_searches()
+        # Runs here while the other tools are in flight
+        for call_id, tool_function_name, arguments in self.local_calls:
+            self.results[call_id] = run_tool(tool_function_name, dict(arguments, labels=self.labels))
+        self.local_calls = []
+        for call_id, future in self.futures.items():
+            if isinstance(future, tuple):
+                future, i = future
+                self.results[call_id] = future.result()[i]
             else:
-                messages.append({
-                    "role":"tool", 
-                    "tool_call_id":tool_call_id, 
-                    "name": tool_function_name, 
-                    "content": "Error: function does not exist"
-                })            
-            
-        # Step 4: Invoke the chat completions API with the function response appended to the messages list
+                self.results[call_id] = future.result()
+        return [self.results[tool_call.id] for tool_call in tool_calls]
+
+def run_tool_calls(tool_calls, labels=None):
+    # Results for tool_calls, in order
+    with stage("tools"):
+        runner = ToolCallRunner(labels)
+        # Every search goes out in one batch, ahead of the other tools
+        searches = [tool_call for tool_call in tool_calls if tool_call.function.name == 'find_related_subjects']
+        for tool_call in searches:
+            runner.start(tool_call)
+        runner.flush_searches()
+        for tool_call in tool_calls:
+            if tool_call.function.name != 'find_related_subjects':
+                runner.start(tool_call)
+        return runner.finish(tool_calls)
+
+def record_usage(llm_span, usage):
+    if usage is not None:
+        llm_span.set(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
+
+def model_context(messages, llm_span):
+    context = context_manager.prepare(messages)
+    llm_span.set(context_tokens=context_manager.count(context), history_tokens=context_manager.count(messages))
+    return context
+
+def run_assistant_rounds(messages, max_rounds=MAX_TOOL_ROUNDS, labels=None):
+    for round_number in range(max_rounds):
+        with span("llm", model=GPT_MODEL, round=round_number) as s:
+            chat_response = chat_completion_request(
+                model_context(messages, s), tools=tools, model=GPT_MODEL
+            )    
+            record_usage(s, getattr(chat_response, "usage", None))
+
+        assistant_message = chat_response.choices[0].message
+        print("assistant_message: ",assistant_message)
+
+        tool_calls = assistant_message.tool_calls
+        if not tool_calls:
+            messages.append({"role": "assistant", "content": assistant_message.content})
+            return
+
+        # Call the functions and append the results to the messages list, then ask the model again.
         # Note that messages with role 'tool' must be a response to a preceding message with 'tool_calls'
-        add_assistant_response(messages)
-    else:
-        messages.append({"role": "assistant", "content": assistant_message.content})
+        messages.append(assistant_message)
+        for tool_call, results in zip(tool_calls, run_tool_calls(tool_calls, labels)):
+            messages.append(tool_message(tool_call, results))
+
+    # Too many tool rounds, make the model answer with what it has
+    print(f"stopping tool calls after {max_rounds} rounds")
+    with span("llm", model=GPT_MODEL, round=max_rounds, tool_choice="none") as s:
+        chat_response = chat_completion_request(
+            model_context(messages, s), tools=tools, tool_choice="none", model=GPT_MODEL
+        )
+        record_usage(s, getattr(chat_response, "usage", None))
+    messages.append({"role": "assistant", "content": chat_response.choices[0].message.content})
+
+@retry(wait=wait_random_exponential(multiplier=1, max=40), stop=stop_after_attempt(3), reraise=True)
+def chat_completion_stream(messages, tools=None, tool_choice=None, model=GPT_MODEL):
+    try:
+        return client.chat.completions.create(
+            model=model,
+            messages=messages,
+            tools=tools,
+            tool_choice=tool_choice,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+    except Exception as e:
+        print("Unable to start ChatCompletion stream")
+        print(f"Exception: {e}")
+        raise
+
+def streamed_tool_call(parts):
+    return ChatCompletionMessageToolCall(
+        id=parts["id"], type="function", function=Function(name=parts["name"], arguments=parts["arguments"])
+    )
+
+def timed_chunks(stream_factory, llm_span):
+    # Iterate a completion stream, counting only the time spent waiting on the model as "llm"
+    with stage("llm"):
+        stream = stream_factory()
+        iterator = iter(stream)
+    first_chunk = True
+    while True:
+        with stage("llm"):
+            chunk = next(iterator, None)
+        if chunk is None:
+            return
+        if first_chunk:
+            first_chunk = False
+            llm_span.set(first_chunk_ms=round((time.time() - llm_span.start) * 1000, 2))
+        record_usage(llm_span, getattr(chunk, "usage", None))
+        yield chunk
+
+def stream_assistant_rounds(messages, max_rounds=MAX_TOOL_ROUNDS, labels=None):
+    # Generator of the assistant's reply text. Tool-call deltas are
+    # assembled on the fly and each call starts as soon as the next one begins, i.e. once
+    # its arguments are complete; searches wait for the end of the message so they all go
+    # out in one batch. The final answer is appended to messages at the end.
+    for round_number in range(max_rounds + 1):
+        tool_choice = "none" if round_number == max_rounds else None
+        if tool_choice:
+            print(f"stopping tool calls after {max_rounds} rounds")
+        runner = ToolCallRunner(labels)
+        content = []
+        call_parts = {}
+        # The span also covers the time the reader takes to consume the streamed text
+        with span("llm.stream", model=GPT_MODEL, round=round_number) as s:
+            context = model_context(messages, s)
+            for chunk in timed_chunks(lambda: chat_completion_stream(context, tools=tools, tool_choice=tool_choice, model=GPT_MODEL), s):
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta.content:
+                    content.append(delta.content)
+                    yield delta.content
+                for tool_call_delta in delta.tool_calls or []:
+                    if tool_call_delta.index not in call_parts:
+                        # A new call begins, so the previous ones are complete
+                        for parts in call_parts.values():
+                            if not parts["started"]:
+                                parts["started"] = True
+                                runner.start(streamed_tool_call(parts))
+                        call_parts[tool_call_delta.index] = dict(id=None, name="", arguments="", started=False)
+                    parts = call_parts[tool_call_delta.index]
+                    if tool_call_delta.id:
+                        parts["id"] = tool_call_delta.id
+                    if tool_call_delta.function:
+                        parts["name"] += tool_call_delta.function.name or ""
+                        parts["arguments"] += tool_call_delta.function.arguments or ""
+
+        tool_calls = [streamed_tool_call(call_parts[index]) for index in sorted(call_parts)]
+        if not tool_calls:
+            messages.append({"role": "assistant", "content": "".join(content)})
+            return
+
+        for index, tool_call in zip(sorted(call_parts), tool_calls):
+            if not call_parts[index]["started"]:
+                runner.start(tool_call)
+        messages.append({
+            "role": "assistant",
+            "content": "".join(content) or None,
+            "tool_calls": [tool_call.model_dump() for tool_call in tool_calls],
+        })
+        with stage("tools"):
+            tool_results = runner.finish(tool_calls)
+        for tool_call, results in zip(tool_calls, tool_results):
+            messages.append(tool_message(tool_call, results))
+
+def standalone_question(messages):
+    # The latest user message if it is the first one of the conversation. Follow-up
+    # questions depend on earlier turns, so only standalone ones use the response cache.
+    user_messages = [message for message in messages if isinstance(message, dict) and message.get("role") == "user"]
+    if len(user_messages) == 1 and messages[-1] is user_messages[0]:
+        return user_messages[0]["content"]
+    return None
+
+def prompt_version(messages):
+    system_prompt = next((message["content"] for message in messages
+                          if isinstance(message, dict) and message.get("role") == "system"), "")
+    return content_version(system_prompt)
+
+def highlighted_ids(labels):
+    labels = labels if labels is not None else session_labels()
+    return list(labels.data.get("ind", [])) if labels is not None else []
+
+def cached_response(messages, question, labels=None):
+    # Serve a cached answer for question: highlight its subjects, append it to messages and return it
+    with span("response_cache.lookup") as s:
+        entry = response_cache.lookup(embed_query(question), prompt_version(messages), active_catalog().version)
+        cache_stats = response_cache.stats()
+        s.set(hit=entry is not None, cache_size=cache_stats["size"], hit_rate=cache_stats["hit_rate"])
+    if entry is None:
+        return None
+    if entry["highlights"]:
+        highlight_subjects(entry["highlights"], labels)
+    messages.append({"role": "assistant", "content": entry["answer"]})
+    return entry["answer"]
+
+def remember_response(messages, question, highlights_before, labels=None):
+    answer = messages[-1].get("content") if isinstance(messages[-1], dict) else None
+    if not answer:
+        return
+    highlights = highlighted_ids(labels)
+    response_cache.store(embed_query(question), question, answer,
+                         highlights if highlights != highlights_before else [],
+                         prompt_version(messages), active_catalog().version)
+
+def add_assistant_response(messages, max_rounds=MAX_TOOL_ROUNDS, labels=None, use_cache=True, year=None):
+    # year selects the catalog the tools search, the registry's default year if None
+    with span("turn", streaming=False, messages=len(messages)) as s, use_catalog(year) as state:
+        s.set(year=state.year)
+        question = standalone_question(messages) if use_cache else None
+        if question is not None and cached_response(messages, question, labels) is not None:
+            s.set(cached=True)
+            return
+        highlights_before = highlighted_ids(labels)
+        run_assistant_rounds(messages, max_rounds, labels)
+        if question is not None:
+            remember_response(messages, question, highlights_before, labels)
 
-# print(find_related_subjects("system architecture"))
\ No newline at end of file
+def stream_assistant_response(messages, max_rounds=MAX_TOOL_ROUNDS, labels=None, use_cache=True, year=None):
+    # Generator of the assistant's reply text, for st.write_stream
+    with span("turn", streaming=True, messages=len(messages)) as s, use_catalog(year) as state:
+        s.set(year=state.year)
+        question = standalone_question(messages) if use_cache else None
+        if question is not None:
+            answer = cached_response(messages, question, labels)
+            if answer is not None:
+                s.set(cached=True)
+                yield answer
+                return
+        highlights_before = highlighted_ids(labels)
+        yield from stream_assistant_rounds(messages, max_rounds, labels)
+        if question is not None:
+            remember_response(messages, question, highlights_before, labels)
@@ -0,0 +1,89 @@
+import os
+import numpy as np
+
+from embedding_store import build_base, save_arrays
+from search_engine import normalize_rows
+
+# Inverted-file (IVF) index for approximate cosine search: subjects are
+# clustered with spherical k-means and a query only scores the members of
+# the nprobe clusters whose centroids are closest to it.
+
+DEFAULT_NPROBE = 8
+
+def index_path(file_name, build=None):
+    return build_base(file_name, build) + '.ivf.npz'
+
+def _assign(matrix, centroids, block_size=8192):
+    assignment = np.empty(matrix.shape[0], dtype=np.int32)
+    for start in range(0, matrix.shape[0], block_size):
+        block = matrix[start:start + block_size]
+        assignment[start:start + block_size] = np.argmax(block @ centroids.T, axis=1)
+    return assignment
+
+def _train_centroids(matrix, n_lists, n_iter, sample_size, seed):
+    rng = np.random.default_rng(seed)
+    sample = matrix
+    if matrix.shape[0] > sample_size:
+        sample = matrix[np.sort(rng.choice(matrix.shape[0], sample_size, replace=False))]
+    centroids = sample[rng.choice(sample.shape[0], n_lists, replace=False)].copy()
+    for _ in range(n_iter):
+        assignment = _assign(sample, centroids)
+        counts = np.bincount(assignment, minlength=n_lists)
+        order = np.argsort(assignment, kind='stable')
+        sums = np.zeros_like(centroids)
+        filled = counts > 0
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[filled]
+        sums[filled] = np.add.reduceat(sample[order], starts, axis=0)
+        empty = ~filled
+        # Re-seed empty clusters with random points so every list stays useful
+        sums[empty] = sample[rng.choice(sample.shape[0], int(empty.sum()), replace=False)]
+        centroids = normalize_rows(sums)
+    return centroids
+
+class IVFIndex:
+    def __init__(self, centroids, list_offsets, list_rows, nprobe=DEFAULT_NPROBE):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.list_offsets = np.asarray(list_offsets, dtype=np.int64)
+        self.list_rows = np.asarray(list_rows, dtype=np.int32)
+        self.nprobe = nprobe
+
+    @property
+    def n_lists(self):
+        return self.centroids.shape[0]
+
+    @property
+    def size(self):
+        return self.list_rows.shape[0]
+
+    @classmethod
+    def build(cls, embeddings, n_lists=None, n_iter=10, sample_size=100000, seed=42):
+        matrix = normalize_rows(embeddings)
+        if n_lists is None:
+            n_lists = max(1, int(4 * np.sqrt(matrix.shape[0])))
+        n_lists = min(n_lists, matrix.shape[0])
+        centroids = _train_centroids(matrix, n_lists, n_iter, sample_size, seed)
+        assignment = _assign(matrix, centroids)
+        list_rows = np.argsort(assignment, kind='stable').astype(np.int32)
+        list_offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=n_lists))])
+        return cls(centroids, list_offsets, list_rows)
+
+    def candidates(self, query_embedding, nprobe=None):
+        # Rows stored in the nprobe lists closest to the (normalized) query
+        nprobe = min(nprobe or self.nprobe, self.n_lists)
+        centroid_scores = self.centroids @ query_embedding
+        if nprobe < self.n_lists:
+            probes = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        else:
+            probes = np.arange(self.n_lists)
+        return np.concatenate([self.list_rows[self.list_offsets[i]:self.list_offsets[i + 1]] for i in probes])
+
+    def save(self, file_name, build=None):
+        save_arrays(index_path(file_name, build), centroids=self.centroids, list_offsets=self.list_offsets, list_rows=self.list_rows)
+
+    @classmethod
+    def load(cls, file_name, build=None, nprobe=DEFAULT_NPROBE):
+        path = index_path(file_name, build)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            return cls(data['centroids'], data['list_offsets'], data['list_rows'], nprobe=nprobe)
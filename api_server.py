@@ -0,0 +1,412 @@
+import argparse
+import asyncio
+import json
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from http import HTTPStatus
+from types import SimpleNamespace
+
+import agent
+from advisor_prompt import with_system_prompt
+from tracing import span, submit_in_context, tracer
+
+# Headless JSON API over the advisor, for clients other than the Streamlit app (LMS
+# integrations, load tests, or app.py itself with ADVISOR_API_URL set):
+#
+#   OPENAI_API_KEY=... python api_server.py --port 8000
+#   curl -s localhost:8000/search -d '{"query": "system dynamics", "top_n": 5}'
+#
+# Endpoints; "year" selects the catalog, the registry's default year if omitted:
+#   GET  /health   years served and pending requests
+#   GET  /stats    latency per span, search batching, query embedding and response cache counters
+#   POST /subjects {"subject_ids": [...]}                -> {"result": <get_subject_info text>}
+#   POST /search   {"query": "...", "top_n": 10}         -> {"result": <find_related_subjects text>}
+#   POST /chat     {"messages": [...], "highlights": {...}, "stream": false, "use_cache": true}
+#                  -> {"messages": [<messages added by the turn>], "answer": "...", "highlights": {...}}
+#      The advisor's system prompt is added if messages don't start with one. With "stream": true
+#      the reply is newline-delimited JSON: {"delta": "..."} lines, then the result with "done": true.
+#
+# One process holds one embedding model and one catalog registry for every request. Encoding
+# and search run on a small worker pool; searches arriving while it is busy are batched into
+# one encode call and one batched search per catalog year. Chat turns, which mostly wait on
+# the LLM, run on their own pool. Each kind of request has a bound on how many may be pending;
+# past it the server answers 503 with Retry-After rather than queueing without limit.
+
+# Encoding is CPU-bound and the model already uses several cores per call
+SEARCH_WORKERS = 2
+CHAT_WORKERS = 16
+MAX_BATCH_SIZE = 32
+BATCH_WINDOW_SECONDS = 0.005
+MAX_PENDING_SEARCHES = 256
+MAX_PENDING_LOOKUPS = 256
+MAX_PENDING_CHATS = 64
+MAX_TOP_N = 50
+MAX_BODY_BYTES = 1 << 20
+MAX_HEADERS = 100
+# Also the idle timeout of a kept-alive connection
+REQUEST_TIMEOUT_SECONDS = 30
+RETRY_AFTER_SECONDS = 1
+
+class HTTPError(Exception):
+    def __init__(self, status, message=None, headers=None):
+        super().__init__(message or HTTPStatus(status).phrase)
+        self.status = status
+        self.headers = headers or {}
+
+class Overloaded(HTTPError):
+    def __init__(self, kind):
+        super().__init__(503, f"Too many pending {kind} requests, retry later",
+                         {"Retry-After": str(RETRY_AFTER_SECONDS)})
+
+class Admission:
+    # At most `workers` requests of one kind run at a time and at most `max_pending` are
+    # running or waiting; more are turned away
+    def __init__(self, kind, workers, max_pending):
+        self.kind = kind
+        self.max_pending = max_pending
+        self.pending = 0
+        self._semaphore = asyncio.Semaphore(workers)
+
+    @asynccontextmanager
+    async def slot(self):
+        if self.pending >= self.max_pending:
+            raise Overloaded(self.kind)
+        self.pending += 1
+        try:
+            async with self._semaphore:
+                yield
+        finally:
+            self.pending -= 1
+
+def search_batch(queries, top_n, year):
+    with agent.use_catalog(year), span("api.search_batch", queries=len(queries), top_n=top_n):
+        return agent.find_related_subjects_batch(queries, top_n)
+
+class SearchBatcher:
+    # Searches from concurrent requests share one find_related_subjects_batch call: each
+    # batch takes what is queued, waiting at most BATCH_WINDOW_SECONDS for more, and is
+    # split by (year, top_n). While every worker is busy, new searches queue up and go
+    # out together in the next batch.
+    def __init__(self, executor, workers, max_batch_size=MAX_BATCH_SIZE, window=BATCH_WINDOW_SECONDS,
+                 max_pending=MAX_PENDING_SEARCHES):
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.window = window
+        self._queue = asyncio.Queue(maxsize=max_pending)
+        self._workers = asyncio.Semaphore(workers)
+        self._tasks = set()
+        self.batches = 0
+        self.queries = 0
+
+    @property
+    def pending(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        return dict(pending=self.pending, batches=self.batches, queries=self.queries,
+                    mean_batch_size=round(self.queries / self.batches, 2) if self.batches else 0.0)
+
+    async def search(self, query, top_n, year):
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((year, top_n, query, future))
+        except asyncio.QueueFull:
+            raise Overloaded("search")
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._workers.acquire()
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch_size:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            task = asyncio.create_task(self._run_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch):
+        try:
+            groups = defaultdict(list)
+            for year, top_n, query, future in batch:
+                # Skip callers that went away while queued
+                if not future.done():
+                    groups[(year, top_n)].append((query, future))
+            for (year, top_n), items in groups.items():
+                queries = [query for query, _ in items]
+                self.batches += 1
+                self.queries += len(queries)
+                try:
+                    results = await asyncio.wrap_future(
+                        submit_in_context(self.executor, search_batch, queries, top_n, year))
+                except Exception as e:
+                    for _, future in items:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                for (_, future), result in zip(items, results):
+                    if not future.done():
+                        future.set_result(result)
+        finally:
+            self._workers.release()
+
+def subject_info(subject_ids, year):
+    with agent.use_catalog(year):
+        return agent.get_subject_info(subject_ids)
+
+def as_json(message):
+    # The agent keeps the model's tool-call messages as OpenAI objects
+    return message if isinstance(message, dict) else message.model_dump(exclude_none=True)
+
+def chat_result(messages, start, labels):
+    return {
+        "messages": [as_json(message) for message in messages[start:]],
+        "answer": messages[-1].get("content") if isinstance(messages[-1], dict) else None,
+        "highlights": dict(labels.data),
+    }
+
+def chat_turn(messages, labels, year, use_cache):
+    start = len(messages)
+    agent.add_assistant_response(messages, labels=labels, use_cache=use_cache, year=year)
+    return chat_result(messages, start, labels)
+
+def stream_chat_turn(loop, queue, messages, labels, year, use_cache):
+    # Runs on the chat pool and hands each piece of the reply to the event loop
+    start = len(messages)
+    try:
+        for text in agent.stream_assistant_response(messages, labels=labels, use_cache=use_cache, year=year):
+            loop.call_soon_threadsafe(queue.put_nowait, {"delta": text})
+        loop.call_soon_threadsafe(queue.put_nowait, dict(chat_result(messages, start, labels), done=True))
+    except Exception as e:
+        print(f"Streamed chat turn failed: {e}")
+        loop.call_soon_threadsafe(queue.put_nowait, {"error": str(e), "done": True})
+
+async def read_request(reader):
+    # (method, path, version, headers, body), or None once the client has closed the connection
+    line = await reader.readline()
+    if not line.strip():
+        return None
+    try:
+        method, target, version = line.decode('latin-1').split()
+    except ValueError:
+        raise HTTPError(400, "Malformed request line")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        if len(headers) >= MAX_HEADERS:
+            raise HTTPError(431)
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    if 'chunked' in headers.get('transfer-encoding', '').lower():
+        raise HTTPError(411)
+    try:
+        length = int(headers.get('content-length', 0))
+    except ValueError:
+        raise HTTPError(400, "Invalid Content-Length")
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(413)
+    body = await reader.readexactly(length) if length > 0 else b''
+    return method.upper(), target.split('?', 1)[0].rstrip('/') or '/', version, headers, body
+
+def response_head(status, headers):
+    lines = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}"] + [f"{name}: {value}" for name, value in headers.items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode('latin-1')
+
+async def write_json(writer, status, payload, keep_alive, headers=None):
+    body = json.dumps(payload).encode('utf-8')
+    head = {"Content-Type": "application/json", "Content-Length": len(body),
+            "Connection": "keep-alive" if keep_alive else "close"}
+    head.update(headers or {})
+    writer.write(response_head(status, head) + body)
+    await writer.drain()
+
+async def write_chunk(writer, data):
+    writer.write(f"{len(data):x}\r\n".encode('latin-1') + data + b"\r\n")
+    await writer.drain()
+
+def parse_body(body):
+    try:
+        payload = json.loads(body or b'{}')
+    except ValueError:
+        raise HTTPError(400, "Body is not valid JSON")
+    if not isinstance(payload, dict):
+        raise HTTPError(400, "Body must be a JSON object")
+    return payload
+
+JSON_TYPES = {str: "a string", int: "an integer", bool: "a boolean", list: "a list", dict: "an object"}
+
+def field(payload, name, kind, default=None):
+    value = payload.get(name, default)
+    if not isinstance(value, kind) or (kind is int and isinstance(value, bool)):
+        raise HTTPError(400, f"'{name}' must be {JSON_TYPES[kind]}")
+    return value
+
+def catalog_year(payload):
+    year = payload.get("year")
+    year = str(year) if year is not None else agent.catalog_registry.default_year
+    years = agent.catalog_registry.years
+    if year not in years:
+        raise HTTPError(400, f"Unknown catalog year {year}, available: {', '.join(years)}")
+    return year
+
+class AdvisorAPI:
+    def __init__(self, search_workers=SEARCH_WORKERS, chat_workers=CHAT_WORKERS, max_batch_size=MAX_BATCH_SIZE,
+                 batch_window=BATCH_WINDOW_SECONDS, max_pending_searches=MAX_PENDING_SEARCHES,
+                 max_pending_chats=MAX_PENDING_CHATS):
+        self.search_executor = ThreadPoolExecutor(max_workers=search_workers, thread_name_prefix="api-search")
+        self.chat_executor = ThreadPoolExecutor(max_workers=chat_workers, thread_name_prefix="api-chat")
+        self.batcher = SearchBatcher(self.search_executor, search_workers, max_batch_size, batch_window,
+                                     max_pending_searches)
+        self.lookups = Admission("lookup", search_workers, MAX_PENDING_LOOKUPS)
+        self.chats = Admission("chat", chat_workers, max_pending_chats)
+        self.routes = {
+            ('GET', '/health'): self.health,
+            ('GET', '/stats'): self.stats,
+            ('POST', '/subjects'): self.subjects,
+            ('POST', '/search'): self.search,
+            ('POST', '/chat'): self.chat,
+        }
+        self._batcher_task = None
+
+    async def start(self, host, port):
+        self._batcher_task = asyncio.create_task(self.batcher.run())
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(read_request(reader), REQUEST_TIMEOUT_SECONDS)
+                except HTTPError as e:
+                    # The rest of the request was not read, so the connection can't be reused
+                    await write_json(writer, e.status, {"error": str(e)}, False, e.headers)
+                    break
+                if request is None:
+                    break
+                method, path, version, headers, body = request
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                await self.handle_request(writer, method, path, body, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError):
+            # Idle or slow client, or a line longer than the stream limit
+            pass
+        finally:
+            writer.close()
+
+    async def handle_request(self, writer, method, path, body, keep_alive):
+        with span("api.request", method=method, path=path) as s:
+            try:
+                handler = self.routes.get((method, path))
+                if handler is None:
+                    raise HTTPError(405 if any(route_path == path for _, route_path in self.routes) else 404)
+                payload = parse_body(body) if method == 'POST' else {}
+                result = await handler(payload, writer, keep_alive)
+            except HTTPError as e:
+                s.set(status=e.status)
+                await write_json(writer, e.status, {"error": str(e)}, keep_alive, e.headers)
+                return
+            except ConnectionError:
+                raise
+            except Exception as e:
+                print(f"{method} {path} failed: {e}")
+                s.set(status=500)
+                await write_json(writer, 500, {"error": str(e)}, keep_alive)
+                return
+            s.set(status=200)
+            # Streaming handlers have already written their response
+            if result is not None:
+                await write_json(writer, 200, result, keep_alive)
+
+    async def health(self, payload, writer, keep_alive):
+        registry = agent.catalog_registry
+        return {"status": "ok", "years": registry.years, "default_year": registry.default_year,
+                "pending": {"search": self.batcher.pending, "lookup": self.lookups.pending, "chat": self.chats.pending}}
+
+    async def stats(self, payload, writer, keep_alive):
+        return {"spans": tracer.summary(), "search_batching": self.batcher.stats(),
+                "query_cache": agent.query_cache.stats(), "response_cache": agent.response_cache.stats()}
+
+    async def subjects(self, payload, writer, keep_alive):
+        subject_ids = field(payload, "subject_ids", list)
+        if not all(isinstance(id, str) for id in subject_ids):
+            raise HTTPError(400, "'subject_ids' must be a list of strings")
+        year = catalog_year(payload)
+        async with self.lookups.slot():
+            result = await asyncio.wrap_future(submit_in_context(self.search_executor, subject_info, subject_ids, year))
+        return {"result": result}
+
+    async def search(self, payload, writer, keep_alive):
+        query = field(payload, "query", str)
+        top_n = field(payload, "top_n", int, 10)
+        if not 1 <= top_n <= MAX_TOP_N:
+            raise HTTPError(400, f"'top_n' must be between 1 and {MAX_TOP_N}")
+        return {"result": await self.batcher.search(query, top_n, catalog_year(payload))}
+
+    async def chat(self, payload, writer, keep_alive):
+        messages = field(payload, "messages", list)
+        if not all(isinstance(message, dict) and isinstance(message.get("role"), str) for message in messages):
+            raise HTTPError(400, "'messages' must be a list of objects with a role")
+        messages = with_system_prompt(messages)
+        # Highlighted subjects as the map's label data (x, y, t, ind); the turn's highlight_subjects calls replace it
+        labels = SimpleNamespace(data=field(payload, "highlights", dict, dict(x=[], y=[], t=[], ind=[])))
+        year = catalog_year(payload)
+        use_cache = field(payload, "use_cache", bool, True)
+        stream = field(payload, "stream", bool, False)
+        async with self.chats.slot():
+            if not stream:
+                return await asyncio.wrap_future(
+                    submit_in_context(self.chat_executor, chat_turn, messages, labels, year, use_cache))
+
+            loop = asyncio.get_running_loop()
+            queue = asyncio.Queue()
+            submit_in_context(self.chat_executor, stream_chat_turn, loop, queue, messages, labels, year, use_cache)
+            writer.write(response_head(200, {"Content-Type": "application/x-ndjson", "Transfer-Encoding": "chunked",
+                                             "Connection": "keep-alive" if keep_alive else "close"}))
+            while True:
+                event = await queue.get()
+                await write_chunk(writer, (json.dumps(event) + "\n").encode('utf-8'))
+                if event.get("done"):
+                    break
+            await write_chunk(writer, b"")
+        return None
+
+async def serve(host, port, **options):
+    api = AdvisorAPI(**options)
+    server = await api.start(host, port)
+    print(f"advisor API listening on http://{host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="JSON API for subject lookup, search and the advisor chat")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--search-workers', type=int, default=SEARCH_WORKERS, help="threads encoding and searching")
+    parser.add_argument('--chat-workers', type=int, default=CHAT_WORKERS, help="chat turns running at once")
+    parser.add_argument('--max-batch-size', type=int, default=MAX_BATCH_SIZE)
+    parser.add_argument('--batch-window', type=float, default=BATCH_WINDOW_SECONDS,
+                        help="seconds a search batch waits for more queries")
+    parser.add_argument('--max-pending-searches', type=int, default=MAX_PENDING_SEARCHES)
+    parser.add_argument('--max-pending-chats', type=int, default=MAX_PENDING_CHATS)
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args.host, args.port, search_workers=args.search_workers, chat_workers=args.chat_workers,
+                          max_batch_size=args.max_batch_size, batch_window=args.batch_window,
+                          max_pending_searches=args.max_pending_searches, max_pending_chats=args.max_pending_chats))
+    except KeyboardInterrupt:
+        pass
@@ -1,11 +1,11 @@
 import streamlit as st
 st.set_page_config(layout="wide")
 
-import math
-from bokeh.plotting import ColumnDataSource, figure
-from agent import add_assistant_response
-from load_embeddings import get_2d_embeddings_from_file
-from bokeh.models import TapTool, CustomJS, LabelSet, WheelZoomTool
+from bokeh.plotting import ColumnDataSource
+from advisor_client import ADVISOR_API_URL
+from advisor_prompt import initial_messages
+from subject_map import get_session_map
+from tracing import span, tracer
 from streamlit_js_eval import streamlit_js_eval
 
 
@@ -24,53 +24,41 @@ st.markdown(
     unsafe_allow_html=True,
 )
 
+if ADVISOR_API_URL:
+    # A thin client of api_server.py: this process only loads the catalog for the map
+    from advisor_client import add_assistant_response, stream_assistant_response
+    from load_embeddings import get_catalog_registry
+    catalog_registry = get_catalog_registry()
+    # The caches live in the service, see its /stats
+    cache_stats = None
+else:
+    from agent import add_assistant_response, catalog_registry, query_cache, response_cache, stream_assistant_response
+
+    def cache_stats():
+        return [dict(cache="query embeddings", **query_cache.stats()), dict(cache="responses", **response_cache.stats())]
+
+# Stream assistant replies into the chat pane instead of waiting for the full completion
+STREAM_RESPONSES = True
+# "webgl" renders large maps on the GPU, "canvas" is the Bokeh default
+MAP_OUTPUT_BACKEND = "webgl"
+# Span latency histograms and recent spans under the map; also shown with ?debug=1
+DEBUG_PANEL = False
+
 if 'labels' not in st.session_state:
     st.session_state['labels'] = ColumnDataSource(data=dict(x=[], y=[], t=[], ind=[]))
 
+# Catalog year searched by the advisor and shown on the map
+years = catalog_registry.years
+year = st.sidebar.selectbox("Catalog year", years, index=years.index(catalog_registry.default_year) if catalog_registry.default_year in years else 0)
+if st.session_state.get('catalog_year') != year:
+    if 'catalog_year' in st.session_state:
+        # Highlights refer to the previous year's map
+        st.session_state.labels.data = dict(x=[], y=[], t=[], ind=[])
+    st.session_state['catalog_year'] = year
+
 # Initialize the chat history
 if 'messages' not in st.session_state:
-    learning_objectives = {
-        "lo.SA01": "Structure and lead the early conceptual phases of the system development process.",
-        "lo.SA02": "Define system architecture, explain what a system is, and how behavior emerges.",
-        "lo.SA03": "Effectively describe the architecture of systems and critique descriptions of system architecture.",
-        "lo.SA04": "Define the role of a system architect, describe the organizational issues likely to arise for the architect, shape where the architecting process fits within a PDP, and manage the architecture through operation and evolution.",
-        "lo.SA05": "Identify and prioritize the stakeholders of the system quantitatively and qualitatively, and elicit and prioritize their needs.",
-        "lo.SA06": "Articulate how a product creates value and competitive advantage from its system architecture, and articulate how corporate strategy, marketing, regulation, and platform strategies influence architecture and vice versa.",
-        "lo.SA07": "Generate several architectures for new or improved systems using both structured and unstructured approaches.",
-        "lo.SA08": "Select preferred system architectures from a set of architectures, a list of architectural decisions, or a tradespace of architectures.",
-        "lo.SA09": "Define and produce the deliverables of the architect needed to define the architecture of a system, including actively choosing abstractions, hierarchy, and a decomposition for the system.",
-        "lo.SA10": "Develop a personal set of guiding principles for successful architecting.",
-        "lo.SE01": "Understand fundamental principles and methods of engineering complex systems and how they may evolve in practice due to changes in enabling technological and organizational systems and context.",
-        "lo.SE02": "Elicit, define and formally articulate system value to help guide system priorities and structure value-generating activities across the system lifecycle.",
-        "lo.SE03": "Analyze, understand, and represent system behavior by defining and analyzing system missions, operations, modes, and use cases.",
-        "lo.SE04": "Define and manage requirements over the system’s lifecycle, tailoring the process to accommodate the system, its context, and emerging technologies and methods.",
-        "lo.SE05": "Define and systematically explore the system’s tradespace in order to optimally select amongst competing alternatives and objectives.",
-        "lo.SE06": "Define and manage the internal and external interfaces of a system given a particular choice of system boundary, architecture and decomposition.",
-        "lo.SE07": "Analyze and manage changes to the system over its lifecycle.",
-        "lo.SE08": "Understand the role of rigorous models of cyber-physical systems, formal modeling languages, and related approaches in the use of simulation and modeling in the system development process.",
-        "lo.SE09": "Plan and execute a system verification and validation program, including the design, analysis, and sequencing of appropriate experiments and test campaigns.",
-        "lo.SE10": "Understand the role of the system engineer in tailoring the system engineering approach to ensure maximum value delivery over the lifecycle of the system, including development, manufacturing, and operations.",
-        "lo.PM01": "Explore and define linkages between a project and the portfolio of an organization.",
-        "lo.PM02": "Define a project’s strategic purpose with estimates of systemic value, including metrics for verification.",
-        "lo.PM03": "Define a project charter in response to strategy and stakeholder views, including targets and priorities across cost, schedule, scope and risk.",
-        "lo.PM04": "Generate a project plan that is feasible given scope, resources, roles, dependencies, and risks.",
-        "lo.PM05": "Model a project as integrated product, process, and organizational systems. Leverage dynamic modeling to forecast emergent outcomes including rework.",
-        "lo.PM06": "Recommend a plan to stakeholders with a trade-space of alternatives across cost, schedule, scope, and risk.",
-        "lo.PM07": "Credibly challenge unrealistic expectations related to project cost, schedule, scope, and risk. Lead others to shift attention, analyze, learn, and adapt.",
-        "lo.PM08": "Establish a monitor and ongoing adaptive control approach including measures of value, scope progress, change, risk, cost, and other metrics.",
-        "lo.PM09": "Identify key skills and attitudes required for effective leadership and team readiness in systems development programs.",
-        "lo.PM10": "Design, select, and prepare project architecture and teamwork for diverse and geographically distributed projects."
-    }
-
-    context_str = "EM.411, EM.412, and EM.413 are System Design and Management (SDM) Core subjects. The learning objectives (lo) of SDM are " + "\n".join([f"{key}: {value}" for key, value in learning_objectives.items()]) + ''' 
-    You are an academic advisor, helping SDM students explore subjects provided by MIT. Don't make assumptions about what values to plug into functions. Ask for clarification if a user request is ambiguous. Always include both subject id and subject title such as 'EM.411 Foundations of System Design and Management' when referring to a subject. Highlight the related subjects in the graph.
-    Be concise and straight to the point when you response.
-    '''        
-
-    initial_messages = []
-    initial_messages.append({"role": "system", "content": context_str})
-    initial_messages.append({"role": "assistant", "content": "how can I help you today?"})
-    st.session_state['messages'] = initial_messages
+    st.session_state['messages'] = initial_messages()
 
 st.title('MIT Subject Explorer')
 page_height = int(streamlit_js_eval(js_expressions='screen.height', key = 'SCR1'))
@@ -82,85 +70,50 @@ with col1:
     
     if prompt := st.chat_input("What is up?"):   
         st.session_state.messages.append({"role": "user", "content": prompt})
-        add_assistant_response(st.session_state.messages)
+        if not STREAM_RESPONSES:
+            try:
+                add_assistant_response(st.session_state.messages, labels=st.session_state.labels, year=year)
+            except Exception as e:
+                st.error(f"The advisor could not answer: {e}")
 
     with chat_container:
         # Display chat messages from history on app rerun
         for message in st.session_state.messages:
-            if "role" in message and (message["role"] == "user" or message["role"] == "assistant"):
+            if "role" in message and (message["role"] == "user" or message["role"] == "assistant") and message.get("content"):
                 with st.chat_message(message["role"]):
                     st.markdown(message["content"])
+
+        # Stream the reply token by token; it is added to the history once complete
+        if prompt and STREAM_RESPONSES:
+            with st.chat_message("assistant"):
+                try:
+                    st.write_stream(stream_assistant_response(st.session_state.messages, labels=st.session_state.labels, year=year))
+                except Exception as e:
+                    # The model request failed after its retries
+                    st.error(f"The advisor could not answer: {e}")
         
 # graph
 with col2:
-    TOOLTIPS = """
-    <div style="width:300px;">
-    @id @title <br> <br>
-    </div>
-    """
-
-    data = get_2d_embeddings_from_file('full_embeddings.json')
-
     # Calculate the remaining height for the graph
     graph_height = max(page_height - 600, 500)  # Match the chat container height
 
-    p = figure(width=graph_height, height=graph_height, x_range=(-2, 12), y_range=(2, 15), tooltips=TOOLTIPS,
-            title="UMAP projection of the embeddings of MIT subjects")
-    
-    # labels = st.session_state.labels 
-    labels = ColumnDataSource(data=dict(x=[], y=[], t=[], ind=[]))
-    labels.data = dict(st.session_state.labels.data)
-    p.add_layout(LabelSet(x='x', y='y', text='t', y_offset=5, x_offset=5, source=labels, text_font_size='8pt'))
-
-    code = """
-    const data = labels.data
-    for (const key in points) {
-        if (points[key].selected.indices.length > 0) {
-            const ind = points[key].selected.indices[0];
-            
-            const text = points[key].data.id[ind] + ' ' + points[key].data.title[ind];
-            if (!data.t.includes(text)) {
-                data.x.push(points[key].data.x[ind]);
-                data.y.push(points[key].data.y[ind]);
-                data.t.push(text);
-                data.ind.push(ind);                
-            }
-            window.open('https://student.mit.edu/catalog/search.cgi?search=' + points[key].data.id[ind], '_blank');
-            break;
-        }
-    }
-    labels.change.emit();
-    """
-
-    types =  ['Core',    'Eng & Mgmt Depth', 'Eng Depth', 'Mgmt Depth', 'Eng & Mgmt Elective', 'Eng Elective', 'Mgmt Elective', 'Other']
-    colors = ['#0460D9', '#F2A413',          '#750014',   '#358C6C',    '#F2A413',             '#750014',      '#358C6C',       'gray']
-    points = dict()
-
-    for t in types:
-        source = ColumnDataSource(data[data["type"] == t])
-        
-        # Calculate the size based on the value of data["c"]
-        sizes = [5 + int(round(math.log(c, 5), 0) * 3) for c in source.data["c"]]
-        source.data['size'] = sizes  # Add sizes to the ColumnDataSource
-        
-        points[t] = source
-        
-        points[t] = source
-        if(t=='Core'):
-            p.square('x', 'y', size='size', source=source, alpha=0.8, legend_label=t, color=colors[types.index(t)])
-        elif 'Depth' in t:
-            p.square('x', 'y', size='size', source=source, alpha=0.5, legend_label=t, color=colors[types.index(t)])
-        elif 'Elective' in t:
-            p.triangle('x', 'y', size='size', source=source, alpha=0.5, legend_label=t, color=colors[types.index(t)])
-        else:
-            p.circle('x', 'y', size='size', source=source, alpha=0.3, legend_label=t, color=colors[types.index(t)])
-        p.legend.title = 'Subject Type'
-        p.legend.location = "top_left"
-        p.legend.click_policy="hide"
-        
-    callback=CustomJS(args=dict(points=points, labels=labels), code=code)
-    p.add_tools(TapTool(callback=callback))
-    # Enable zoom tool by default
-    p.toolbar.active_scroll = p.select_one(WheelZoomTool)
-
-    st.bokeh_chart(p)
\ No newline at end of file
+    with span("map.render", height=graph_height, backend=MAP_OUTPUT_BACKEND) as s:
+        p, labels = get_session_map(catalog_registry.get(year), graph_height, MAP_OUTPUT_BACKEND)
+        # The cached figure is reused; only its highlight labels are updated. Unchanged
+        # labels give an identical chart message, which Streamlit does not resend
+        labels.data = dict(st.session_state.labels.data)
+        s.set(labels=len(labels.data['t']))
+
+        st.bokeh_chart(p)
+
+    if DEBUG_PANEL or st.query_params.get("debug") == "1":
+        with st.expander("Performance"):
+            st.caption("Latency per span since the server started")
+            st.dataframe([dict(span=name, **summary) for name, summary in tracer.summary().items()], hide_index=True)
+            if cache_stats is not None:
+                st.caption("Caches")
+                st.dataframe(cache_stats(), hide_index=True)
+            st.caption("Recent spans")
+            st.dataframe([dict(name=record['name'], ms=record['duration_ms'], trace=record['trace_id'],
+                               attributes=str(record['attributes'])) for record in reversed(tracer.recent_spans())],
+                         hide_index=True)
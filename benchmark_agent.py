@@ -0,0 +1,117 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from advisor_prompt import initial_messages
+from mock_llm_server import DEFAULT_SCRIPT, start_in_background
+from tracing import collect_stages
+
+# End-to-end latency benchmark of the agent loop against the local mock LLM server.
+# Drives add_assistant_response (or the streaming loop) through the scripted
+# conversations, then reports p50/p95/p99 per stage and per turn, and throughput
+# with N concurrent simulated sessions:
+#
+#   python benchmark_agent.py --sessions 8 --latency 0.3
+#
+# Stages: encode, search, tools (waiting on tool results), llm (waiting on the model), total.
+# The response cache is bypassed, since replaying the same script would only measure cache hits.
+
+STAGES = ['encode', 'search', 'tools', 'llm', 'total']
+PERCENTILES = [50, 95, 99]
+
+def run_turn(agent, messages, labels, stream):
+    with collect_stages() as stages:
+        start = time.perf_counter()
+        if stream:
+            for _ in agent.stream_assistant_response(messages, labels=labels, use_cache=False):
+                pass
+        else:
+            agent.add_assistant_response(messages, labels=labels, use_cache=False)
+        stages.add('total', time.perf_counter() - start)
+    return stages.as_dict()
+
+def run_session(agent, conversation, stream):
+    # One simulated user going through a scripted conversation; returns per-turn stage timings
+    from bokeh.models import ColumnDataSource
+    labels = ColumnDataSource(data=dict(x=[], y=[], t=[], ind=[]))
+    # The app's system prompt and greeting, so the context sent to the model matches a real session
+    messages = initial_messages()
+    turns = []
+    for turn in conversation:
+        messages.append({"role": "user", "content": turn["user"]})
+        turns.append(run_turn(agent, messages, labels, stream))
+    return turns
+
+def summarize(turns):
+    summary = {}
+    for name in STAGES:
+        values = np.array([turn.get(name, 0.0) for turn in turns]) * 1000
+        summary[name] = {f"p{p}": round(float(np.percentile(values, p)), 2) for p in PERCENTILES}
+        summary[name]["mean"] = round(float(values.mean()), 2)
+    return summary
+
+def print_summary(title, summary):
+    print(title)
+    print(f"  {'stage':<8}" + "".join(f"{'p' + str(p) + ' ms':>12}" for p in PERCENTILES) + f"{'mean ms':>12}")
+    for name in STAGES:
+        row = summary[name]
+        print(f"  {name:<8}" + "".join(f"{row['p' + str(p)]:>12}" for p in PERCENTILES) + f"{row['mean']:>12}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Agent loop latency benchmark against the mock LLM server")
+    parser.add_argument('--script', default=DEFAULT_SCRIPT)
+    parser.add_argument('--base-url', help="use an already running mock server instead of starting one")
+    parser.add_argument('--latency', type=float, default=0.3, help="mock seconds before the first token")
+    parser.add_argument('--token-latency', type=float, default=0.005, help="mock seconds per token")
+    parser.add_argument('--jitter', type=float, default=0.2)
+    parser.add_argument('--repeat', type=int, default=3, help="passes over the script in the sequential run")
+    parser.add_argument('--sessions', type=int, default=4, help="concurrent simulated sessions")
+    parser.add_argument('--stream', action='store_true', help="benchmark the streaming loop")
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    base_url = args.base_url
+    if base_url is None:
+        server = start_in_background(script=args.script, port=0, latency=args.latency,
+                                     token_latency=args.token_latency, jitter=args.jitter)
+        base_url = server.base_url
+    # The agent builds its OpenAI client at import time
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ.setdefault("OPENAI_API_KEY", "mock")
+    import agent
+
+    with open(args.script, 'r', encoding='utf-8') as f:
+        conversations = json.load(f)
+
+    # Warm up the model and caches so the numbers describe steady state
+    agent.warm_up_model(background=False)
+    run_session(agent, conversations[0], args.stream)
+
+    sequential = []
+    for _ in range(args.repeat):
+        for conversation in conversations:
+            sequential.extend(run_session(agent, conversation, args.stream))
+    results = {"sequential": summarize(sequential)}
+    print_summary(f"Sequential: {len(sequential)} turns", results["sequential"])
+
+    sessions = [conversations[i % len(conversations)] for i in range(args.sessions)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.sessions) as executor:
+        concurrent = [turn for turns in executor.map(lambda c: run_session(agent, c, args.stream), sessions) for turn in turns]
+    elapsed = time.perf_counter() - start
+    results["concurrent"] = summarize(concurrent)
+    results["concurrent"]["sessions"] = args.sessions
+    results["concurrent"]["turns_per_second"] = round(len(concurrent) / elapsed, 2)
+    print_summary(f"Concurrent: {args.sessions} sessions, {len(concurrent)} turns", results["concurrent"])
+    print(f"  throughput: {results['concurrent']['turns_per_second']} turns/s")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+import argparse
+import json
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Load test of a running api_server.py: N concurrent clients send the golden set queries
+# to /search (or /subjects lookups of their expected subjects) and the benchmark reports
+# throughput, latency percentiles, how many requests were turned away with 503, and the
+# server's mean search batch size:
+#
+#   python api_server.py --port 8000 &
+#   python benchmark_api.py --url http://127.0.0.1:8000 --clients 32 --requests 50
+
+DEFAULT_GOLDEN_SET = 'search_golden_set.json'
+PERCENTILES = [50, 95, 99]
+
+def request(url, path, payload, timeout):
+    # (HTTP status, seconds)
+    data = json.dumps(payload).encode('utf-8')
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url + path, data=data), timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    return status, time.perf_counter() - start
+
+def run_client(url, path, payloads, timeout):
+    return [request(url, path, payload, timeout) for payload in payloads]
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent load test of the advisor API service")
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--endpoint', choices=['search', 'subjects'], default='search')
+    parser.add_argument('--golden-set', default=DEFAULT_GOLDEN_SET)
+    parser.add_argument('--clients', type=int, default=16, help="concurrent clients")
+    parser.add_argument('--requests', type=int, default=50, help="requests per client")
+    parser.add_argument('--top-n', type=int, default=10)
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    url = args.url.rstrip('/')
+    with open(args.golden_set, 'r', encoding='utf-8') as f:
+        golden = json.load(f)
+    if args.endpoint == 'search':
+        payloads = [{"query": case["query"], "top_n": args.top_n} for case in golden]
+    else:
+        payloads = [{"subject_ids": case["expected"]} for case in golden]
+    # Each client starts at a different point of the golden set
+    clients = [[payloads[(i + j) % len(payloads)] for j in range(args.requests)] for i in range(args.clients)]
+
+    batching_before = json.load(urllib.request.urlopen(url + '/stats'))['search_batching']
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clients) as executor:
+        results = [result for client in executor.map(lambda p: run_client(url, '/' + args.endpoint, p, args.timeout), clients)
+                   for result in client]
+    elapsed = time.perf_counter() - start
+    batching = json.load(urllib.request.urlopen(url + '/stats'))['search_batching']
+
+    statuses = np.array([status for status, _ in results])
+    latencies = np.array([seconds for status, seconds in results if status == 200]) * 1000
+    batches = batching['batches'] - batching_before['batches']
+    report = dict(
+        endpoint=args.endpoint, clients=args.clients, requests=len(results),
+        ok=int((statuses == 200).sum()), rejected=int((statuses == 503).sum()),
+        errors=int(((statuses != 200) & (statuses != 503)).sum()),
+        requests_per_second=round(len(results) / elapsed, 2),
+        latency_ms={f"p{p}": round(float(np.percentile(latencies, p)), 2) for p in PERCENTILES} if len(latencies) else {},
+        mean_batch_size=round((batching['queries'] - batching_before['queries']) / batches, 2) if batches else 0.0,
+    )
+    print(f"{report['requests']} requests from {args.clients} clients in {elapsed:.2f} s: "
+          f"{report['requests_per_second']} requests/s")
+    print(f"  ok {report['ok']}, rejected (503) {report['rejected']}, errors {report['errors']}")
+    print("  latency " + "  ".join(f"{name} {value} ms" for name, value in report['latency_ms'].items()))
+    if args.endpoint == 'search':
+        print(f"  mean search batch size {report['mean_batch_size']}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == '__main__':
+    main()
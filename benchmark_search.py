@@ -0,0 +1,161 @@
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+from ann_index import IVFIndex
+from embedding_model import embed_queries
+from lexical_index import LexicalIndex
+from search_engine import SearchEngine
+from subject_catalog import SubjectCatalog
+
+# Offline relevance and latency benchmark of the find_related_subjects retrieval
+# backends on a golden set of advisor queries mapped to the subjects they should find:
+#
+#   python benchmark_search.py --k 10 --output search_results.json
+#   python benchmark_search.py --baseline search_results.json   # exits 1 on a regression
+#
+# Backends: exact float32 cosine, the IVF index, float16 and int8 quantized matrices,
+# and hybrid (cosine + BM25, as the agent searches) on float32 and int8. Queries are
+# encoded once up front, so latency is the search alone. recall@k and MRR are computed
+# with the similarity threshold applied, like the agent; recall@k without it is also
+# reported. Memory is the size of the matrix and index searched.
+
+DEFAULT_GOLDEN_SET = 'search_golden_set.json'
+# Same as agent.threshold
+DEFAULT_THRESHOLD = 0.42
+
+def load_golden_set(file_name, catalog):
+    with open(file_name, 'r', encoding='utf-8') as f:
+        golden = json.load(f)
+    cases = []
+    for case in golden:
+        missing = [id for id in case['expected'] if catalog.row(id) is None]
+        if missing:
+            print(f"golden set: {missing} not searchable in this catalog, ignored for {case['query']!r}")
+        expected = {id.upper() for id in case['expected']} - {id.upper() for id in missing}
+        if expected:
+            cases.append(dict(query=case['query'], expected=expected))
+    return cases
+
+def index_nbytes(index):
+    if index is None:
+        return 0
+    return index.centroids.nbytes + index.list_offsets.nbytes + index.list_rows.nbytes
+
+def build_backends(catalog, file_name, nprobe):
+    # name -> (search function(query_embedding, query, top_n, threshold) -> rows, memory in bytes)
+    matrix = catalog.search_embeddings()
+    lexical_index = LexicalIndex.from_catalog(catalog)
+    index = IVFIndex.load(file_name, catalog.build)
+    if index is None or index.size != len(catalog.search_rows):
+        print("no matching IVF index next to the store, building one")
+        index = IVFIndex.build(matrix)
+
+    engines = {
+        'exact': SearchEngine(matrix, catalog.search_ids),
+        'ivf': SearchEngine(matrix, catalog.search_ids, index=index, exact_search_max=0),
+        'float16': SearchEngine(matrix, catalog.search_ids, dtype='float16'),
+        'int8': SearchEngine(matrix, catalog.search_ids, dtype='int8'),
+    }
+    backends = {}
+    for name, engine in engines.items():
+        backends[name] = (
+            lambda embedding, query, top_n, threshold, engine=engine:
+                engine.search_rows(embedding, top_n, threshold, nprobe=nprobe)[0],
+            engine.matrix.nbytes + index_nbytes(engine.index),
+        )
+    # The hybrid backends run the agent's search path: BM25 scoring plus the batched hybrid search
+    for name in ('exact', 'int8'):
+        engine = engines[name]
+        backends['hybrid-' + name] = (
+            lambda embedding, query, top_n, threshold, engine=engine:
+                engine.hybrid_search_rows_batch([embedding], [lexical_index.scores(query)], top_n, threshold,
+                                                nprobe=nprobe)[0][0],
+            engine.matrix.nbytes,
+        )
+    return backends
+
+def evaluate(search, cases, embeddings, search_ids, k, threshold):
+    recalls, unfiltered, reciprocal_ranks, latencies = [], [], [], []
+    for case, embedding in zip(cases, embeddings):
+        start = time.perf_counter()
+        rows = search(embedding, case['query'], k, threshold)
+        latencies.append(time.perf_counter() - start)
+        found = [search_ids[row].upper() for row in rows]
+        recalls.append(len(case['expected'].intersection(found)) / len(case['expected']))
+        ranks = [rank for rank, id in enumerate(found, 1) if id in case['expected']]
+        reciprocal_ranks.append(1 / ranks[0] if ranks else 0.0)
+        found = [search_ids[row].upper() for row in search(embedding, case['query'], k, None)]
+        unfiltered.append(len(case['expected'].intersection(found)) / len(case['expected']))
+    latencies = np.array(latencies) * 1000
+    return dict(
+        recall=round(float(np.mean(recalls)), 4),
+        recall_unfiltered=round(float(np.mean(unfiltered)), 4),
+        mrr=round(float(np.mean(reciprocal_ranks)), 4),
+        p50_ms=round(float(np.percentile(latencies, 50)), 3),
+        p99_ms=round(float(np.percentile(latencies, 99)), 3),
+    )
+
+def regressions(results, baseline, max_quality_drop, max_latency_increase):
+    problems = []
+    for name, row in results['backends'].items():
+        previous = baseline.get('backends', {}).get(name)
+        if previous is None:
+            continue
+        for metric in ('recall', 'mrr'):
+            if row[metric] < previous[metric] - max_quality_drop:
+                problems.append(f"{name}: {metric} {previous[metric]} -> {row[metric]}")
+        if row['p99_ms'] > previous['p99_ms'] * (1 + max_latency_increase):
+            problems.append(f"{name}: p99 {previous['p99_ms']} ms -> {row['p99_ms']} ms")
+    return problems
+
+def main():
+    parser = argparse.ArgumentParser(description="Relevance and latency of the subject search backends")
+    parser.add_argument('--catalog', default='full_embeddings', help="embedding store to search")
+    parser.add_argument('--golden-set', default=DEFAULT_GOLDEN_SET)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument('--nprobe', type=int, default=None)
+    parser.add_argument('--repeat', type=int, default=5, help="passes over the golden set for the latency numbers")
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    parser.add_argument('--baseline', help="results JSON to compare against; exit with status 1 on a regression")
+    parser.add_argument('--max-quality-drop', type=float, default=0.02, help="allowed absolute drop in recall@k or MRR")
+    parser.add_argument('--max-latency-increase', type=float, default=0.5, help="allowed relative increase in p99 latency")
+    args = parser.parse_args()
+
+    catalog = SubjectCatalog.load(args.catalog)
+    cases = load_golden_set(args.golden_set, catalog)
+    embeddings = np.stack(embed_queries([case['query'] for case in cases]))
+    search_ids = catalog.search_ids
+    backends = build_backends(catalog, args.catalog, args.nprobe)
+
+    results = dict(catalog=args.catalog, catalog_version=catalog.version, queries=len(cases), k=args.k,
+                   threshold=args.threshold, backends={})
+    print(f"{len(cases)} queries, k={args.k}, threshold={args.threshold}")
+    print(f"  {'backend':<14}{'recall':>9}{'no thr.':>9}{'MRR':>8}{'p50 ms':>9}{'p99 ms':>9}{'MB':>9}")
+    for name, (search, nbytes) in backends.items():
+        repeated = cases * args.repeat
+        row = evaluate(search, repeated, np.concatenate([embeddings] * args.repeat), search_ids, args.k, args.threshold)
+        row['megabytes'] = round(nbytes / 2**20, 2)
+        results['backends'][name] = row
+        print(f"  {name:<14}{row['recall']:>9}{row['recall_unfiltered']:>9}{row['mrr']:>8}"
+              f"{row['p50_ms']:>9}{row['p99_ms']:>9}{row['megabytes']:>9}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        problems = regressions(results, baseline, args.max_quality_drop, args.max_latency_increase)
+        for problem in problems:
+            print("regression:", problem)
+        if problems:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+# Cold start benchmark: imports each module in a fresh interpreter and reports the
+# median import time over several runs, and which heavy build-time packages got
+# loaded along the way. With --model it also times loading the embedding model,
+# i.e. how long until the first query can be encoded:
+#
+#   python benchmark_startup.py --runs 5 --model
+#
+# Run it from the directory holding the embedding store; agent builds its search
+# state at import time.
+
+DEFAULT_MODULES = ['embedding_model', 'load_embeddings', 'subject_map', 'agent']
+HEAVY_MODULES = ['umap', 'numba', 'sentence_transformers', 'torch', 'sklearn', 'openpyxl', 'pandas']
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+__import__({module!r})
+imported = time.perf_counter() - start
+result = dict(import_s=imported, heavy=[name for name in {heavy!r} if name in sys.modules])
+if {model!r}:
+    from embedding_model import warm_up_model
+    start = time.perf_counter()
+    warm_up_model(background=False)
+    result['model_s'] = time.perf_counter() - start
+print(json.dumps(result))
+"""
+
+def probe(module, model, env):
+    code = PROBE.format(module=module, heavy=HEAVY_MODULES, model=model)
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, env=env, check=True).stdout
+    # The module may print while importing; the result is the last line
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold start time of the serving modules")
+    parser.add_argument('modules', nargs='*', default=DEFAULT_MODULES)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--model', action='store_true', help="also time loading the embedding model")
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    # agent needs an API key at import time; no request is made
+    env.setdefault("OPENAI_API_KEY", "startup-benchmark")
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [os.path.dirname(os.path.abspath(__file__)), env.get("PYTHONPATH")]))
+
+    results = {}
+    print(f"  {'module':<18}{'import ms':>12}{'model ms':>12}  heavy modules loaded")
+    for module in args.modules:
+        runs = [probe(module, args.model, env) for _ in range(args.runs)]
+        results[module] = dict(
+            import_ms=round(float(np.median([run['import_s'] for run in runs])) * 1000, 1),
+            model_ms=round(float(np.median([run['model_s'] for run in runs])) * 1000, 1) if args.model else None,
+            heavy=runs[-1]['heavy'],
+        )
+        row = results[module]
+        model_ms = row['model_ms'] if row['model_ms'] is not None else '-'
+        print(f"  {module:<18}{row['import_ms']:>12}{model_ms:>12}  {', '.join(row['heavy']) or 'none'}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
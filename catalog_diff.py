@@ -0,0 +1,63 @@
+# Year-over-year differences between two subject catalogs, by subject id:
+# added, removed, and changed (same id, different title or description).
+#
+# A diff keeps only the ids and texts it reports, not the catalogs, so it never holds
+# on to a superseded catalog and its memory-mapped embeddings.
+
+class CatalogDiff:
+    def __init__(self, from_year, to_year, added, removed, changed, new_ids):
+        # added and removed: {id: (label, info)}; changed: {id: (label, old info, new info)}
+        self.from_year = from_year
+        self.to_year = to_year
+        self.added = added
+        self.removed = removed
+        self.changed = changed
+        self.new_ids = frozenset(new_ids)
+
+    @classmethod
+    def compute(cls, old_catalog, new_catalog, from_year, to_year):
+        old_ids, new_ids = set(old_catalog.index), set(new_catalog.index)
+        changed = {}
+        for id in sorted(old_ids & new_ids):
+            old_row, new_row = old_catalog.index[id], new_catalog.index[id]
+            if (old_catalog.titles[old_row] != new_catalog.titles[new_row]
+                    or old_catalog.descriptions[old_row] != new_catalog.descriptions[new_row]):
+                changed[id] = (new_catalog.label(new_row), old_catalog.info(old_row), new_catalog.info(new_row))
+        added = {id: (new_catalog.label(new_catalog.index[id]), new_catalog.info(new_catalog.index[id]))
+                 for id in sorted(new_ids - old_ids)}
+        removed = {id: (old_catalog.label(old_catalog.index[id]), old_catalog.info(old_catalog.index[id]))
+                   for id in sorted(old_ids - new_ids)}
+        return cls(from_year, to_year, added, removed, changed, new_ids)
+
+    def status(self, subject_id):
+        id = subject_id.upper()
+        for status, ids in (('added', self.added), ('removed', self.removed), ('changed', self.changed)):
+            if id in ids:
+                return status
+        return 'unchanged' if id in self.new_ids else 'not found'
+
+    def summary(self, limit=30):
+        lines = [f"Between {self.from_year} and {self.to_year}: {len(self.added)} subjects added, "
+                 f"{len(self.removed)} removed, {len(self.changed)} changed."]
+        for name, entries in (('Added', self.added), ('Removed', self.removed), ('Changed', self.changed)):
+            if entries:
+                shown = [entry[0] for entry in list(entries.values())[:limit]]
+                more = f" and {len(entries) - limit} more" if len(entries) > limit else ""
+                lines.append(f"{name}: " + "; ".join(shown) + more)
+        return "\n".join(lines)
+
+    def describe(self, subject_id):
+        status = self.status(subject_id)
+        id = subject_id.upper()
+        if status == 'added':
+            return f"{subject_id} is new in {self.to_year}. " + self.added[id][1]
+        if status == 'removed':
+            return f"{subject_id} was removed after {self.from_year}. " + self.removed[id][1]
+        if status == 'changed':
+            _, old_info, new_info = self.changed[id]
+            return (f"{subject_id} changed between {self.from_year} and {self.to_year}.\n"
+                    f"{self.from_year}: " + old_info + "\n"
+                    f"{self.to_year}: " + new_info)
+        if status == 'unchanged':
+            return f"{subject_id} is unchanged between {self.from_year} and {self.to_year}."
+        return f"Subject {subject_id} not found in {self.from_year} or {self.to_year}"
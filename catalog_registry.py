@@ -0,0 +1,187 @@
+import os
+import threading
+import time
+import numpy as np
+
+from ann_index import IVFIndex
+from catalog_diff import CatalogDiff
+from embedding_model import embed_queries
+from embedding_store import build_files, has_store, meta_path, store_base
+from knn_graph import KNNGraph
+from learning_objectives import LEARNING_OBJECTIVES, ObjectiveMatrix
+from lexical_index import LexicalIndex
+from quantization import QuantizedMatrix
+from search_engine import SearchEngine
+from subject_catalog import SubjectCatalog
+from tracing import span
+
+# Catalog years served by one process. Each year's store is memory-mapped read-only,
+# so every worker process on the host shares its pages, and within a process all
+# sessions share one CatalogState per year. A state never changes once built: when a
+# rebuilt store lands, the next lookup after RELOAD_CHECK_SECONDS builds a new state
+# and swaps it in, while turns that already hold the old one finish on it.
+
+CATALOG_FILES = {
+    "2025": "full_embeddings",
+    "2024": "catalog_2024",
+}
+DEFAULT_YEAR = "2025"
+# Search scores int8 codes: a quarter of the float32 memory (python quantization.py reports the recall@10)
+SEARCH_DTYPE = "int8"
+RELOAD_CHECK_SECONDS = 10
+
+def published_signature(file_name):
+    # Changes whenever a build is published; None if there is no binary store
+    if not has_store(file_name):
+        return None
+    stat = os.stat(meta_path(file_name))
+    return stat.st_mtime_ns, stat.st_size
+
+def files_signature(file_name, build):
+    # Changes when a file of the build is added, rewritten or removed, e.g. by quantization.py --build
+    signature = []
+    for path in sorted(build_files(file_name, build)):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        signature.append((path, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+def store_signature(file_name, build):
+    published = published_signature(file_name)
+    return None if published is None else (published, files_signature(file_name, build))
+
+def has_catalog(file_name):
+    return has_store(file_name) or os.path.exists(store_base(file_name) + '.json')
+
+class CatalogState:
+    # The subjects of one catalog year and everything searched over them
+    def __init__(self, year, file_name, search_dtype=SEARCH_DTYPE):
+        self.year = year
+        self.file_name = file_name
+        with span("catalog.load", year=year, file=file_name) as s:
+            # Taken before reading: a build published meanwhile changes the signature, and
+            # a file of this build rewritten after its stat is picked up by the next check
+            published = published_signature(file_name)
+            catalog = SubjectCatalog.load(file_name)
+            if catalog.matrix.shape[0] != len(catalog):
+                # Matrix and metadata come from different builds: the store is being replaced
+                raise ValueError(f"{file_name} has {catalog.matrix.shape[0]} embeddings for {len(catalog)} subjects")
+            self.catalog = catalog
+            self.signature = None if published is None else (published, files_signature(file_name, catalog.build))
+
+            # The derived files are named after the build they were computed from
+            ann_index = IVFIndex.load(file_name, catalog.build)
+            if ann_index is not None and ann_index.size != len(catalog.search_rows):
+                # The index was built over a different set of rows, search exactly instead
+                ann_index = None
+            search_matrix = QuantizedMatrix.load(file_name, search_dtype, catalog.build)
+            if search_matrix is None or len(search_matrix) != len(catalog):
+                # Not built with this build of the store, quantize the float32 matrix at load time instead
+                search_matrix = catalog.search_embeddings()
+            elif len(catalog.search_rows) != len(catalog):
+                search_matrix = search_matrix.take(catalog.search_rows)
+            self.search_engine = SearchEngine(search_matrix, catalog.search_ids, index=ann_index, dtype=search_dtype)
+            self.lexical_index = LexicalIndex.from_catalog(catalog)
+
+            self.knn_graph = KNNGraph.load(file_name, catalog.build)
+            if self.knn_graph is not None and self.knn_graph.size != len(catalog):
+                # Built for a different store, similar subjects fall back to a search
+                self.knn_graph = None
+            self.searchable = np.zeros(len(catalog), dtype=bool)
+            self.searchable[catalog.search_rows] = True
+
+            self._objectives = ObjectiveMatrix.load(file_name, catalog.build)
+            if self._objectives is not None and self._objectives.size != len(catalog):
+                self._objectives = None
+            self._objectives_lock = threading.Lock()
+            s.set(rows=len(catalog), searchable=len(catalog.search_rows), version=catalog.version)
+
+    @property
+    def version(self):
+        return self.catalog.version
+
+    def objectives(self):
+        # The objective x subject matrix saved with the store, or computed once on first use
+        # (one encode of the objectives) when the store predates it or the objectives changed
+        if self._objectives is None:
+            with self._objectives_lock:
+                if self._objectives is None:
+                    with span("objectives.build", year=self.year):
+                        objective_embeddings = np.stack(embed_queries(list(LEARNING_OBJECTIVES.values())))
+                        self._objectives = ObjectiveMatrix.build(self.catalog.matrix, objective_embeddings)
+        return self._objectives
+
+class CatalogRegistry:
+    def __init__(self, files=CATALOG_FILES, default_year=DEFAULT_YEAR, check_interval=RELOAD_CHECK_SECONDS):
+        self.files = dict(files)
+        self.default_year = default_year
+        self.check_interval = check_interval
+        self._states = {}
+        self._checked = {}
+        self._diffs = {}
+        self._locks = {year: threading.Lock() for year in self.files}
+
+    @property
+    def years(self):
+        # Years with a built store, newest first
+        return sorted((year for year, file_name in self.files.items() if has_catalog(file_name)), reverse=True)
+
+    def get(self, year=None):
+        year = str(year or self.default_year)
+        if year not in self.files:
+            raise KeyError(f"Unknown catalog year {year}, available: {', '.join(self.years)}")
+        state = self._states.get(year)
+        if state is not None and time.monotonic() - self._checked[year] < self.check_interval:
+            return state
+
+        lock = self._locks[year]
+        if state is not None and not lock.acquire(blocking=False):
+            # Another thread is checking or reloading this year; keep serving the current state
+            return state
+        if state is None:
+            lock.acquire()
+        try:
+            state = self._states.get(year)
+            if state is not None and time.monotonic() - self._checked[year] < self.check_interval:
+                return state
+            file_name = self.files[year]
+            if state is None or store_signature(file_name, state.catalog.build) != state.signature:
+                try:
+                    new_state = CatalogState(year, file_name)
+                except (OSError, ValueError) as e:
+                    if state is None:
+                        raise
+                    print(f"Keeping the loaded {year} catalog, reload failed:", str(e))
+                else:
+                    if state is not None:
+                        print(f"Reloaded the {year} catalog: {state.version} -> {new_state.version}")
+                    # A single reference swap: readers see either the old state or the new one
+                    self._states[year] = state = new_state
+            self._checked[year] = time.monotonic()
+            return state
+        finally:
+            lock.release()
+
+    def diff(self, from_year, to_year):
+        # Subjects added, removed and changed between two years, computed once per pair of
+        # versions. Only the diff of the current versions of each pair of years is kept.
+        old, new = self.get(from_year), self.get(to_year)
+        versions = (old.version, new.version)
+        cached = self._diffs.get((old.year, new.year))
+        if cached is not None and cached[0] == versions:
+            return cached[1]
+        with span("catalog.diff", from_year=old.year, to_year=new.year) as s:
+            diff = CatalogDiff.compute(old.catalog, new.catalog, old.year, new.year)
+            s.set(added=len(diff.added), removed=len(diff.removed), changed=len(diff.changed))
+        self._diffs[(old.year, new.year)] = (versions, diff)
+        return diff
+
+    def warm_up(self):
+        # Load every available year and precompute the diffs between consecutive years
+        years = sorted(self.years)
+        for year in years:
+            self.get(year)
+        for from_year, to_year in zip(years, years[1:]):
+            self.diff(from_year, to_year)
@@ -0,0 +1,106 @@
+import json
+
+# Keeps the context sent to the model within a token budget. The session history
+# itself is left untouched; prepare() returns the list of messages to send:
+#  - the leading system messages are passed through as-is, so the prompt prefix stays
+#    byte-identical between turns and provider prompt caching keeps applying;
+#  - tool results of older turns are compacted to their subject titles;
+#  - if that is not enough, the oldest turns are dropped and replaced by a short note
+#    listing what the student asked earlier.
+# The latest turns are always sent in full.
+
+DEFAULT_TOKEN_BUDGET = 12000
+
+def estimate_tokens(text):
+    # About 4 characters per token for English text
+    return (len(text) + 3) // 4
+
+def as_dict(message):
+    if isinstance(message, dict):
+        return message
+    return message.model_dump(exclude_none=True)
+
+def message_tokens(message):
+    tokens = 4 + estimate_tokens(message.get("content") or "")
+    for tool_call in message.get("tool_calls") or []:
+        tokens += estimate_tokens(json.dumps(tool_call))
+    return tokens
+
+def compact_tool_result(content, max_chars):
+    # Keep only the "Title: <id> <title>" part of each search/info result line
+    lines = [line.split(". Description:")[0] for line in (content or "").split("\n")]
+    compact = "\n".join(lines)
+    if len(compact) > max_chars:
+        compact = compact[:max_chars] + " ... [trimmed]"
+    return compact
+
+class ContextManager:
+    def __init__(self, token_budget=DEFAULT_TOKEN_BUDGET, keep_recent_turns=2, tool_result_chars=600):
+        self.token_budget = token_budget
+        self.keep_recent_turns = keep_recent_turns
+        self.tool_result_chars = tool_result_chars
+
+    def split(self, messages):
+        # (leading system messages, turns), where each turn starts at a user message
+        prefix_length = 0
+        while prefix_length < len(messages) and as_dict(messages[prefix_length]).get("role") == "system":
+            prefix_length += 1
+        turns = []
+        for message in messages[prefix_length:]:
+            if not turns or as_dict(message).get("role") == "user":
+                turns.append([])
+            turns[-1].append(message)
+        return messages[:prefix_length], turns
+
+    def compact_turn(self, turn):
+        compacted = []
+        for message in turn:
+            message = as_dict(message)
+            if message.get("role") == "tool":
+                message = dict(message, content=compact_tool_result(message.get("content"), self.tool_result_chars))
+            compacted.append(message)
+        return compacted
+
+    def dropped_note(self, dropped):
+        # System message standing in for the dropped turns, or None if nothing was dropped
+        if not dropped:
+            return None
+        questions = [turn[0].get("content") for turn in dropped if turn[0].get("role") == "user"]
+        note = "Earlier in this conversation the student asked: " + "; ".join(str(q) for q in questions)
+        return {"role": "system", "content": note[:self.tool_result_chars]}
+
+    def prepare(self, messages):
+        prefix, turns = self.split(messages)
+        budget = self.token_budget - sum(message_tokens(as_dict(message)) for message in prefix)
+        recent = turns[-self.keep_recent_turns:] if self.keep_recent_turns else []
+        older = [self.compact_turn(turn) for turn in turns[:len(turns) - len(recent)]]
+        recent_tokens = sum(message_tokens(as_dict(message)) for turn in recent for message in turn)
+        if recent_tokens > budget and len(recent) > 1:
+            # Even the recent turns are too large: compact all but the current one
+            recent = [self.compact_turn(turn) for turn in recent[:-1]] + recent[-1:]
+            recent_tokens = sum(message_tokens(as_dict(message)) for turn in recent for message in turn)
+        older_tokens = [sum(message_tokens(message) for message in turn) for turn in older]
+
+        # The note replacing the dropped turns counts against the budget too
+        dropped = []
+        note_tokens = 0
+        while older and recent_tokens + sum(older_tokens) + note_tokens > budget:
+            dropped.append(older.pop(0))
+            older_tokens.pop(0)
+            note_tokens = message_tokens(self.dropped_note(dropped))
+        note = self.dropped_note(dropped)
+        if note is not None and recent_tokens + sum(older_tokens) + note_tokens > budget:
+            # Only the recent turns are left and the note doesn't fit next to them
+            note = None
+
+        context = list(prefix)
+        if note is not None:
+            context.append(note)
+        for turn in older:
+            context.extend(turn)
+        for turn in recent:
+            context.extend(turn)
+        return context
+
+    def count(self, messages):
+        return sum(message_tokens(as_dict(message)) for message in messages)
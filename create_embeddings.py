@@ -1,7 +1,21 @@
-import json
+import os
+import shutil
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+import joblib
+import numpy as np
 import pandas as pd
-import umap.umap_ as umap
-from sentence_transformers import SentenceTransformer
+from openpyxl import load_workbook
+
+from ann_index import IVFIndex
+from knn_graph import KNNGraph
+from learning_objectives import LEARNING_OBJECTIVES, ObjectiveMatrix
+from quantization import save_quantized
+from embedding_cache import EmbeddingCache
+from embedding_model import MODEL_NAME, create_embeddings, get_model
+from embedding_store import (StoreWriter, build_base, has_store, load_store, records_to_columns, replace_atomically,
+                             write_store)
 
 def read_xls_file(file_path):
     try:
@@ -13,17 +27,188 @@ def read_xls_file(file_path):
     except Exception as e:
         print("An error occurred:", str(e))
         return None
+
+NUMERIC_COLUMNS = ('engUnits', 'mgmtUnits', 'SDMCount')
+
+def iter_xls_chunks(file_path, chunk_size=2000):
+    # Stream the first worksheet as DataFrames of at most chunk_size rows
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows)
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                yield _xls_frame(chunk, header)
+                chunk = []
+        if chunk:
+            yield _xls_frame(chunk, header)
+    finally:
+        workbook.close()
+
+def _xls_frame(rows, header):
+    data = pd.DataFrame(rows, columns=header)
+    # Rows without a subject id are stray cells outside the table (the 2024 catalog has some)
+    data = data[data['SUBJECT_ID'].notna()].reset_index(drop=True)
+    for column in NUMERIC_COLUMNS:
+        if column in data:
+            data[column] = pd.to_numeric(data[column], errors='coerce')
+    # Catalogs before 2025 have no SDMCount column: count their subjects as taken by no SDM student
+    data['SDMCount'] = data['SDMCount'].fillna(0) if 'SDMCount' in data else 0
+    return data
+
+def subject_priority(data):
+    # Priority based on isDepth, isElective, engUnits, mgmtUnits and SDMCount
+    return (
+        (data['isDepth'] == 'Y').astype(int) * 8 +
+        (data['isElective'] == 'Y').astype(int) * 4 +
+        (data['engUnits'].notna() & (data['engUnits'] > 0)).astype(int) +
+        (data['mgmtUnits'].notna() & (data['mgmtUnits'] > 0)).astype(int) +
+        (data['SDMCount'].notna() & (data['SDMCount'] > 0)).astype(int)
+    )
+
+def read_subjects(file_path, chunk_size=2000):
+    # Read the catalog chunk by chunk, keeping only the highest-priority row per SUBJECT_TITLE
+    try:
+        data = None
+        for chunk in iter_xls_chunks(file_path, chunk_size):
+            chunk['priority'] = subject_priority(chunk)
+            data = chunk if data is None else pd.concat([data, chunk], ignore_index=True)
+            data = data.sort_values('priority', ascending=False, kind='stable')
+            data = data.drop_duplicates(subset='SUBJECT_TITLE', keep='first')
+        if data is None:
+            print("No subjects found.")
+            return None
+        return data.drop('priority', axis=1)
+    except FileNotFoundError:
+        print("File not found.")
+        return None
+    except Exception as e:
+        print("An error occurred:", str(e))
+        return None
     
-def create_embeddings(texts):
-    # Load pre-trained model
-    model = SentenceTransformer('all-mpnet-base-v2')
-    
-    # Generate embedding for the given text
-    embedding = model.encode(texts)
-    
-    return embedding
+def _init_encoder_worker(threads):
+    # Each worker process holds its own model and a share of the CPU cores
+    import torch
+    torch.set_num_threads(threads)
+    get_model()
+
+def _encode_batch(texts, batch_size):
+    return get_model().encode(texts, batch_size=batch_size, convert_to_numpy=True)
+
+class EncoderPool:
+    # Encodes text chunks in-process (workers <= 1) or across a pool of CPU worker processes
+    def __init__(self, workers=1, batch_size=64):
+        self.workers = max(1, workers)
+        self.batch_size = batch_size
+        self.executor = None
+        if self.workers > 1:
+            threads = max(1, (os.cpu_count() or 1) // self.workers)
+            self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_encoder_worker,
+                                                initargs=(threads,))
 
-def save_embeddings(data, embeddings, final_2d_embeddings, output_file):
+    @property
+    def max_in_flight(self):
+        return 2 * self.workers
+
+    def submit(self, texts):
+        if self.executor is not None:
+            return self.executor.submit(_encode_batch, texts, self.batch_size)
+        future = Future()
+        future.set_result(_encode_batch(texts, self.batch_size))
+        return future
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+
+class BuildProgress:
+    def __init__(self, total, interval=5.0):
+        self.total = total
+        self.done = 0
+        self.interval = interval
+        self.start_time = time.time()
+        self.last_report = self.start_time
+
+    def update(self, rows):
+        self.done += rows
+        now = time.time()
+        if now - self.last_report >= self.interval or self.done == self.total:
+            self.last_report = now
+            rate = self.done / max(now - self.start_time, 1e-9)
+            print(f"Encoded {self.done}/{self.total} subjects ({rate:.1f} rows/s)")
+
+def encode_to_store(texts, writer, cache, pool, chunk_size=1024):
+    # Encode texts chunk by chunk, skipping cached ones, and write each chunk to the
+    # store as soon as it is ready. Chunks finish in order, so a text scheduled by an
+    # earlier chunk is already cached when a later chunk needs it.
+    keys = [cache.key(text) for text in texts]
+    scheduled = set()
+    in_flight = deque()
+    progress = BuildProgress(len(texts))
+
+    def finish(start, end, missing_keys, future):
+        if missing_keys:
+            cache.add(missing_keys, future.result())
+        writer.write(start, cache.lookup(keys[start:end]))
+        progress.update(end - start)
+
+    for start in range(0, len(texts), chunk_size):
+        end = min(start + chunk_size, len(texts))
+        missing = {}
+        for i in range(start, end):
+            if keys[i] not in cache and keys[i] not in scheduled:
+                missing.setdefault(keys[i], texts[i])
+        scheduled.update(missing)
+        cache.count(end - start - len(missing), len(missing))
+        future = pool.submit(list(missing.values())) if missing else None
+        in_flight.append((start, end, list(missing), future))
+        while len(in_flight) > pool.max_in_flight:
+            finish(*in_flight.popleft())
+    while in_flight:
+        finish(*in_flight.popleft())
+
+def reducer_path(output_file, build=None):
+    return build_base(output_file, build) + '.umap.pkl'
+
+def compute_layout(embeddings, ids, output_file, build, refit=False, drift_threshold=0.2):
+    # 2d UMAP coordinates. Subjects whose embedding is unchanged since the published build keep
+    # their position, new or changed ones are placed with that build's saved reducer.
+    # The reducer is refit when asked to, or when more than drift_threshold of the subjects changed.
+    # Either way the reducer is saved under the new build, which publishes it with the layout.
+    meta, previous_matrix = load_store(output_file) if has_store(output_file) else (None, None)
+    previous_reducer = reducer_path(output_file, meta.get('build')) if meta is not None else None
+    if not refit and previous_reducer is not None and os.path.exists(previous_reducer):
+        previous_columns = meta['columns']
+        previous_rows = {id: row for row, id in enumerate(previous_columns['id'])}
+        final_2d_embeddings = np.empty((len(ids), 2), dtype=np.float32)
+        stale = []
+        for i, id in enumerate(ids):
+            row = previous_rows.get(id)
+            if row is not None and np.array_equal(previous_matrix[row], embeddings[i]):
+                final_2d_embeddings[i] = (previous_columns['x'][row], previous_columns['y'][row])
+            else:
+                stale.append(i)
+        drift = len(stale) / max(len(ids), 1)
+        if drift <= drift_threshold:
+            if stale:
+                umap_reducer = joblib.load(previous_reducer)
+                final_2d_embeddings[stale] = umap_reducer.transform(np.asarray(embeddings[stale]))
+            with open(previous_reducer, 'rb') as source:
+                replace_atomically(reducer_path(output_file, build), lambda f: shutil.copyfileobj(source, f))
+            print(f"Placed {len(stale)} new or changed subjects into the existing layout")
+            return final_2d_embeddings
+        print(f"{drift:.0%} of subjects changed (threshold {drift_threshold:.0%}), refitting the layout")
+
+    # Imported here: numba compilation makes umap slow to import, and encoder workers never need it
+    import umap.umap_ as umap
+    umap_reducer = umap.UMAP(n_components=2, random_state=42)
+    final_2d_embeddings = umap_reducer.fit_transform(embeddings)
+    replace_atomically(reducer_path(output_file, build), lambda f: joblib.dump(umap_reducer, f))
+    return final_2d_embeddings
+
+def save_embeddings(data, embeddings, final_2d_embeddings, output_file, writer=None):
     result = []
     for i in range(len(embeddings)):
         result.append({
@@ -38,45 +223,59 @@ def save_embeddings(data, embeddings, final_2d_embeddings, output_file):
             'c': int(data['SDMCount'].iloc[i]),
             'x': round(float(final_2d_embeddings[i][0]), 4),
             'y': round(float(final_2d_embeddings[i][1]), 4),
-            'e': embeddings[i].tolist(),
         })
     
-    with open(output_file, 'w') as file:
-        json.dump(result, file)
+    # Binary store: float32 matrix + metadata sidecar
+    if writer is not None:
+        writer.commit(records_to_columns(result))
+    else:
+        write_store(records_to_columns(result), embeddings, output_file)
 
-def create_embedding_file(file_name):
-    # Call read_xls_file given the file name as input
-    data = read_xls_file(file_name)
+def create_embedding_file(file_name, output_file='full_embeddings', workers=1, batch_size=64, chunk_size=1024,
+                          refit_layout=False, drift_threshold=0.2):
+    # Read the catalog in chunks, keeping the highest-priority row per title
+    data = read_subjects(file_name)
     
     # Check if data is not None
     if data is not None:
-        # Create a priority column based on isDepth, isElective, engUnits, and mgmtUnits
-        data['priority'] = (
-            (data['isDepth'] == 'Y').astype(int) * 8 +
-            (data['isElective'] == 'Y').astype(int) * 4 +
-            (data['engUnits'].notna() & (data['engUnits'] > 0)).astype(int) +
-            (data['mgmtUnits'].notna() & (data['mgmtUnits'] > 0)).astype(int) +
-            (data['SDMCount'].notna() & (data['SDMCount'] > 0)).astype(int)
-        )
-        
-        # Sort by priority (descending) and remove duplicates based on SUBJECT_TITLE
-        data = data.sort_values('priority', ascending=False)
-        data = data.drop_duplicates(subset='SUBJECT_TITLE', keep='first')
-        
-        # Drop the temporary priority column
-        data = data.drop('priority', axis=1)
-        
         # Create texts from attribute subject_title and subject_description
         texts = ['Title: ' + str(title) + '. Description: ' + str(description) for title, description in zip(data['SUBJECT_TITLE'], data['SUBJECT_DESCRIPTION'])]
         
-        # Create embeddings for the texts
-        embeddings = create_embeddings(texts)
+        # Create embeddings for the texts, reusing cached vectors for unchanged subjects
+        start_time = time.time()
+        cache = EmbeddingCache('embedding_cache', MODEL_NAME)
+        writer = StoreWriter(output_file, len(texts))
+        pool = EncoderPool(workers, batch_size)
+        try:
+            encode_to_store(texts, writer, cache, pool, chunk_size)
+        finally:
+            pool.shutdown()
+        cache.save()
+        cache.summary()
+        print(f"Embedding completed in {time.time() - start_time:.1f} seconds")
+        embeddings = writer.matrix
         
-        # Create 2d embeddings
-        umap_reducer = umap.UMAP(n_components=2, random_state=42)
-        final_2d_embeddings = umap_reducer.fit_transform(embeddings)
+        # Create 2d embeddings, keeping the previous layout stable where possible
+        final_2d_embeddings = compute_layout(embeddings, list(data['SUBJECT_ID']), output_file, writer.build,
+                                             refit=refit_layout, drift_threshold=drift_threshold)
         
-        save_embeddings(data, embeddings, final_2d_embeddings, 'full_embeddings.json')
+        # Files derived from the matrix are saved under the new build before it is
+        # published, so a reader never sees the new matrix without them
+
+        # Approximate nearest-neighbour index, used by the search engine for large catalogs
+        index = IVFIndex.build(embeddings)
+        index.save(output_file, writer.build)
+        # Nearest subjects of every subject, for the similar-subjects tool; exact up to
+        # knn_graph.EXACT_MAX_ROWS subjects, from the IVF index above that
+        KNNGraph.build(embeddings, index=index).save(output_file, writer.build)
+        # float16 and int8 copies for searching with less memory
+        save_quantized(embeddings, output_file, writer.build)
+        # Relevance of every subject to each SDM learning objective
+        objective_embeddings = create_embeddings(list(LEARNING_OBJECTIVES.values()))
+        ObjectiveMatrix.build(embeddings, objective_embeddings).save(output_file, writer.build)
+
+        # Publishes the build
+        save_embeddings(data, embeddings, final_2d_embeddings, output_file, writer=writer)
                 
         print("Embeddings file created successfully.")
     else:
@@ -85,4 +284,6 @@ def create_embedding_file(file_name):
 
 
 # create_embedding_file("MIT-Catalog-2025-SDM V2.xlsx")
-
+# create_embedding_file("MIT-Catalog-2025-SDM V2.xlsx", workers=4, batch_size=32)
+# create_embedding_file("MIT-Catalog-2025-SDM V2.xlsx", refit_layout=True)
+# create_embedding_file("MIT-Catalog-20240624-SDM V2.xlsx", output_file='catalog_2024')
@@ -0,0 +1,82 @@
+import hashlib
+import json
+import os
+import numpy as np
+
+from embedding_store import replace_atomically
+
+# Persistent cache of subject embeddings keyed by a hash of the model name and
+# the exact text that was encoded, so catalog rebuilds only encode new or
+# changed subjects.
+
+def text_key(model_name, text):
+    return hashlib.sha256((model_name + '\0' + text).encode('utf-8')).hexdigest()
+
+class EmbeddingCache:
+    def __init__(self, file_name, model_name):
+        self.file_name = file_name
+        self.model_name = model_name
+        self.rows = {}
+        self._buffer = None
+        self.reused = 0
+        self.encoded = 0
+        self.load()
+
+    @property
+    def paths(self):
+        return self.file_name + '.npy', self.file_name + '.keys.json'
+
+    def load(self):
+        matrix_path, keys_path = self.paths
+        if not (os.path.exists(matrix_path) and os.path.exists(keys_path)):
+            return
+        with open(keys_path, 'r', encoding='utf-8') as f:
+            keys = json.load(f)
+        self._buffer = np.load(matrix_path)
+        self.rows = {key: row for row, key in enumerate(keys)}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, key):
+        return key in self.rows
+
+    def key(self, text):
+        return text_key(self.model_name, text)
+
+    def count(self, reused, encoded):
+        self.reused += reused
+        self.encoded += encoded
+
+    def summary(self):
+        print(f"Embedding cache: {self.reused} reused, {self.encoded} newly encoded")
+
+    def add(self, keys, embeddings):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        start = len(self)
+        end = start + embeddings.shape[0]
+        if self._buffer is None or end > self._buffer.shape[0]:
+            # Grow geometrically so adding chunk after chunk stays linear overall
+            capacity = max(end, 2 * (self._buffer.shape[0] if self._buffer is not None else 0))
+            buffer = np.empty((capacity, embeddings.shape[1]), dtype=np.float32)
+            if start:
+                buffer[:start] = self._buffer[:start]
+            self._buffer = buffer
+        self._buffer[start:end] = embeddings
+        for offset, key in enumerate(keys):
+            self.rows[key] = start + offset
+
+    @property
+    def matrix(self):
+        return None if self._buffer is None else self._buffer[:len(self)]
+
+    def lookup(self, keys):
+        return self.matrix[[self.rows[key] for key in keys]]
+
+    def save(self):
+        if self.matrix is None:
+            return
+        matrix_path, keys_path = self.paths
+        keys = sorted(self.rows, key=self.rows.get)
+        replace_atomically(matrix_path, lambda f: np.save(f, self.matrix))
+        replace_atomically(keys_path, lambda f: f.write(json.dumps(keys).encode('utf-8')))
@@ -0,0 +1,107 @@
+import os
+import threading
+from collections import OrderedDict
+
+from tracing import span
+
+# Serve-time side of the embedding model: the process-wide model, loaded on first use
+# or by a background warm-up, and the query embedding cache. The build pipeline lives
+# in create_embeddings.py.
+
+MODEL_NAME = 'all-mpnet-base-v2'
+# MODEL_WARM_UP=0 skips the background warm-up, e.g. for tests; the model then loads on first use
+MODEL_WARM_UP = os.environ.get("MODEL_WARM_UP", "1") != "0"
+
+# One model per process, shared by every Streamlit session
+_model = None
+_model_lock = threading.Lock()
+
+def get_model():
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                print("loading embedding model: ", MODEL_NAME)
+                with span("model.load", model=MODEL_NAME):
+                    # Imported on first use, so importing this module stays cheap
+                    from sentence_transformers import SentenceTransformer
+                    _model = SentenceTransformer(MODEL_NAME)
+    return _model
+
+def warm_up_model(background=True):
+    # Load the model ahead of the first query, optionally without blocking the caller
+    if not background:
+        get_model()
+        return None
+    if not MODEL_WARM_UP:
+        return None
+    thread = threading.Thread(target=get_model, name="embedding-model-warmup", daemon=True)
+    thread.start()
+    return thread
+
+def create_embeddings(texts):
+    # Load pre-trained model
+    model = get_model()
+    
+    # Generate embedding for the given text
+    embedding = model.encode(texts)
+    
+    return embedding
+
+def normalize_query(query):
+    return " ".join(str(query).lower().split())
+
+class QueryEmbeddingCache:
+    # Bounded LRU cache of query embeddings keyed by normalized query text
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return embedding
+
+    def put(self, key, embedding):
+        with self._lock:
+            self._entries[key] = embedding
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return dict(size=len(self._entries), max_size=self.max_size, hits=self.hits, misses=self.misses,
+                        evictions=self.evictions, hit_rate=round(self.hits / lookups, 3) if lookups else 0.0)
+
+query_cache = QueryEmbeddingCache()
+
+def embed_query(query):
+    return embed_queries([query])[0]
+
+def embed_queries(queries):
+    # Embeddings for several queries, encoding every cache miss in a single encode call
+    keys = [normalize_query(query) for query in queries]
+    embeddings = [query_cache.get(key) for key in keys]
+    missing = list(dict.fromkeys(key for key, embedding in zip(keys, embeddings) if embedding is None))
+    if missing:
+        encoded = dict(zip(missing, create_embeddings(missing)))
+        for key, embedding in encoded.items():
+            query_cache.put(key, embedding)
+        embeddings = [encoded[key] if embedding is None else embedding for key, embedding in zip(keys, embeddings)]
+    return embeddings
@@ -0,0 +1,175 @@
+import glob
+import json
+import os
+import re
+import sys
+import uuid
+import numpy as np
+
+# Binary embedding store: a contiguous float32 matrix saved as .npy next to a
+# compact columnar metadata sidecar. The matrix is opened with np.memmap so
+# every worker process on a host shares the same pages.
+#
+# Each build writes its matrix (and the derived files: indexes, quantized copies)
+# under its own build id, <base>.<build>.npy, and publishes it by replacing the
+# metadata sidecar, which names the build. A rebuild never replaces a file that a
+# reader may still have memory-mapped, which Windows refuses; the files of older
+# builds are deleted once they are no longer in use. Stores written before build
+# ids have no build and use the plain <base>.npy names.
+
+STORE_VERSION = 2
+# Files of a build other than the current one: <base>.<build>.<suffix>
+BUILD_FILE = re.compile(r'\.([0-9a-f]{12})\..+')
+# Files of a store written before build ids
+LEGACY_BUILD_FILES = ('.npy', '.float16.npy', '.int8.npy', '.int8.scale.npy', '.ivf.npz', '.knn.npz', '.objectives.npz',
+                      '.umap.pkl')
+META_COLUMNS = ['id', 't', 'd', 'core', 'depth', 'elect', 'eng', 'mgmt', 'c', 'x', 'y']
+
+def store_base(file_name):
+    for suffix in ('.json', '.npy', '.meta.json'):
+        if file_name.endswith(suffix):
+            return file_name[:-len(suffix)]
+    return file_name
+
+def new_build():
+    return uuid.uuid4().hex[:12]
+
+def build_base(file_name, build=None):
+    # Prefix of the files of one build of the store
+    base = store_base(file_name)
+    return f"{base}.{build}" if build else base
+
+def meta_path(file_name):
+    return store_base(file_name) + '.meta.json'
+
+def matrix_path(file_name, build=None):
+    return build_base(file_name, build) + '.npy'
+
+def has_store(file_name):
+    return os.path.exists(meta_path(file_name))
+
+def replace_atomically(path, write):
+    # Write next to the target and rename, so readers never see a half-written file
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+def save_arrays(path, **arrays):
+    # An .npz sidecar, written atomically
+    replace_atomically(path, lambda f: np.savez(f, **arrays))
+
+def build_files(file_name, build):
+    # The files of one build of the store, except files being written
+    if not build:
+        base = store_base(file_name)
+        return [base + suffix for suffix in LEGACY_BUILD_FILES if os.path.exists(base + suffix)]
+    return [path for path in glob.glob(glob.escape(build_base(file_name, build)) + '.*') if not path.endswith('.tmp')]
+
+def remove_stale_builds(file_name, build):
+    # Delete the files of other builds. A file still memory-mapped by a reader can't be
+    # deleted on Windows, it is left for a later build to remove.
+    base = store_base(file_name)
+    for path in glob.glob(glob.escape(base) + '.*'):
+        suffix = path[len(base):]
+        match = BUILD_FILE.fullmatch(suffix)
+        if (match is not None and match.group(1) != build) or suffix in LEGACY_BUILD_FILES:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+def write_store(columns, embeddings, file_name):
+    # Returns the new build id
+    matrix = np.ascontiguousarray(embeddings, dtype=np.float32)
+    build = new_build()
+    np.save(matrix_path(file_name, build), matrix)
+    write_meta(columns, matrix.shape[0], matrix.shape[1] if matrix.ndim == 2 else 0, file_name, build)
+    remove_stale_builds(file_name, build)
+    return build
+
+def write_meta(columns, count, dim, file_name, build):
+    meta = {
+        'version': STORE_VERSION,
+        'build': build,
+        'count': int(count),
+        'dim': int(dim),
+        'dtype': 'float32',
+        'columns': columns,
+    }
+    replace_atomically(meta_path(file_name), lambda f: f.write(json.dumps(meta, separators=(',', ':')).encode('utf-8')))
+
+class StoreWriter:
+    # Writes the embedding matrix block by block into the memory-mapped .npy file of a
+    # new build, then publishes it with the metadata sidecar in commit(). Files derived
+    # from the matrix can be saved under self.build before the commit.
+    def __init__(self, file_name, count):
+        self.file_name = file_name
+        self.count = count
+        self.matrix = None
+        self.build = new_build()
+        self.path = matrix_path(file_name, self.build)
+
+    def write(self, start, block):
+        block = np.asarray(block, dtype=np.float32)
+        if self.matrix is None:
+            self.matrix = np.lib.format.open_memmap(self.path, mode='w+', dtype=np.float32,
+                                                    shape=(self.count, block.shape[1]))
+        self.matrix[start:start + block.shape[0]] = block
+
+    def commit(self, columns):
+        dim = self.matrix.shape[1] if self.matrix is not None else 0
+        if self.matrix is None:
+            np.save(self.path, np.zeros((self.count, 0), dtype=np.float32))
+        else:
+            self.matrix.flush()
+            self.matrix = None
+        write_meta(columns, self.count, dim, self.file_name, self.build)
+        remove_stale_builds(self.file_name, self.build)
+
+def read_meta(file_name):
+    with open(meta_path(file_name), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def open_matrix(file_name, meta=None):
+    # The matrix of the build named by the metadata
+    meta = meta if meta is not None else read_meta(file_name)
+    return np.load(matrix_path(file_name, meta.get('build')), mmap_mode='r')
+
+def records_to_columns(records):
+    columns = {key: [] for key in META_COLUMNS}
+    for item in records:
+        for key in META_COLUMNS:
+            columns[key].append(item[key])
+    return columns
+
+def load_store(file_name):
+    # Returns the metadata and the (memory-mapped) embedding matrix of the current build.
+    # Falls back to the legacy JSON file when no binary store has been built yet.
+    if has_store(file_name):
+        meta = read_meta(file_name)
+        return meta, open_matrix(file_name, meta)
+
+    json_file = store_base(file_name) + '.json'
+    print("binary embedding store not found, reading legacy file: ", json_file)
+    with open(json_file, 'r', encoding='utf-8') as f:
+        records = json.load(f)
+    matrix = np.array([item['e'] for item in records], dtype=np.float32)
+    return {'build': None, 'columns': records_to_columns(records)}, matrix
+
+def read_store(file_name):
+    # Returns the metadata columns and the embedding matrix
+    meta, matrix = load_store(file_name)
+    return meta['columns'], matrix
+
+def convert_json_to_store(json_file, output_file=None):
+    with open(json_file, 'r', encoding='utf-8') as f:
+        records = json.load(f)
+    matrix = np.array([item['e'] for item in records], dtype=np.float32)
+    output_file = output_file or store_base(json_file)
+    build = write_store(records_to_columns(records), matrix, output_file)
+    print(f"Converted {len(records)} subjects from {json_file} to {matrix_path(output_file, build)}")
+
+if __name__ == '__main__':
+    # python embedding_store.py full_embeddings.json [output_base]
+    convert_json_to_store(*sys.argv[1:3])
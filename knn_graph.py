@@ -0,0 +1,90 @@
+import os
+import numpy as np
+
+from embedding_store import build_base, save_arrays
+from search_engine import normalize_rows
+
+# Top-k neighbour graph over the subject embeddings, computed at build time so
+# "subjects like X" is a row lookup instead of an encode and a scan. Neighbours
+# are int32 store rows and scores float16 cosine similarities, best first.
+
+DEFAULT_NEIGHBORS = 20
+# Largest store whose graph is built exactly; larger stores are built from the IVF index
+EXACT_MAX_ROWS = 20000
+
+def graph_path(file_name, build=None):
+    return build_base(file_name, build) + '.knn.npz'
+
+def _list_blocks(index, k, block_size):
+    # (rows, candidate rows) per IVF list: the members of a list are compared with the
+    # members of the nprobe lists whose centroids are closest to its own, and of as many
+    # further lists as needed to have k candidates besides the row itself
+    lists = [index.list_rows[index.list_offsets[i]:index.list_offsets[i + 1]] for i in range(index.n_lists)]
+    sizes = np.diff(index.list_offsets)
+    for i, members in enumerate(lists):
+        if len(members) == 0:
+            continue
+        order = np.argsort(-(index.centroids @ index.centroids[i]))
+        n_probe = max(min(index.nprobe, index.n_lists), int(np.searchsorted(np.cumsum(sizes[order]), k + 1)) + 1)
+        candidates = np.concatenate([lists[j] for j in order[:n_probe]])
+        for start in range(0, len(members), block_size):
+            yield members[start:start + block_size], candidates
+
+def _top_k(matrix, rows, candidates, k, neighbors, scores):
+    block = matrix[rows] @ matrix[candidates].T
+    # A subject is not its own neighbour
+    block[rows[:, None] == candidates[None, :]] = -np.inf
+    top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(block, top, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    neighbors[rows] = candidates[np.take_along_axis(top, order, axis=1)]
+    scores[rows] = np.take_along_axis(top_scores, order, axis=1)
+
+class KNNGraph:
+    def __init__(self, neighbors, scores):
+        self.neighbors = np.asarray(neighbors, dtype=np.int32)
+        self.scores = np.asarray(scores, dtype=np.float16)
+
+    @property
+    def size(self):
+        return self.neighbors.shape[0]
+
+    @property
+    def k(self):
+        return self.neighbors.shape[1]
+
+    @classmethod
+    def build(cls, embeddings, k=DEFAULT_NEIGHBORS, block_size=1024, index=None, exact_max_rows=EXACT_MAX_ROWS):
+        # Exact neighbours, one block of rows against the whole matrix at a time, which is
+        # quadratic in the number of subjects. Above exact_max_rows, and when an IVF index
+        # is given, the neighbours are searched among the closest lists only.
+        matrix = normalize_rows(embeddings)
+        n = matrix.shape[0]
+        k = min(k, n - 1)
+        neighbors = np.empty((n, k), dtype=np.int32)
+        scores = np.empty((n, k), dtype=np.float16)
+        if k <= 0:
+            return cls(neighbors, scores)
+        if index is not None and n > exact_max_rows:
+            for rows, candidates in _list_blocks(index, k, block_size):
+                _top_k(matrix, rows, candidates, k, neighbors, scores)
+            return cls(neighbors, scores)
+        candidates = np.arange(n)
+        for start in range(0, n, block_size):
+            _top_k(matrix, candidates[start:start + block_size], candidates, k, neighbors, scores)
+        return cls(neighbors, scores)
+
+    def neighbors_of(self, row):
+        # (rows, scores) of the neighbours of a store row, best first
+        return self.neighbors[row], self.scores[row]
+
+    def save(self, file_name, build=None):
+        save_arrays(graph_path(file_name, build), neighbors=self.neighbors, scores=self.scores)
+
+    @classmethod
+    def load(cls, file_name, build=None):
+        path = graph_path(file_name, build)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            return cls(data['neighbors'], data['scores'])
@@ -0,0 +1,120 @@
+import hashlib
+import os
+import numpy as np
+
+from embedding_store import build_base, save_arrays
+from search_engine import normalize_rows
+
+# The SDM learning objectives and their precomputed relevance to every catalog subject.
+# The objective x subject matrix holds the cosine similarity of each objective to each
+# store row, so mapping objectives to subjects and checking how well a set of subjects
+# covers the objectives are array lookups, with no encode and no scan.
+
+LEARNING_OBJECTIVES = {
+    "lo.SA01": "Structure and lead the early conceptual phases of the system development process.",
+    "lo.SA02": "Define system architecture, explain what a system is, and how behavior emerges.",
+    "lo.SA03": "Effectively describe the architecture of systems and critique descriptions of system architecture.",
+    "lo.SA04": "Define the role of a system architect, describe the organizational issues likely to arise for the architect, shape where the architecting process fits within a PDP, and manage the architecture through operation and evolution.",
+    "lo.SA05": "Identify and prioritize the stakeholders of the system quantitatively and qualitatively, and elicit and prioritize their needs.",
+    "lo.SA06": "Articulate how a product creates value and competitive advantage from its system architecture, and articulate how corporate strategy, marketing, regulation, and platform strategies influence architecture and vice versa.",
+    "lo.SA07": "Generate several architectures for new or improved systems using both structured and unstructured approaches.",
+    "lo.SA08": "Select preferred system architectures from a set of architectures, a list of architectural decisions, or a tradespace of architectures.",
+    "lo.SA09": "Define and produce the deliverables of the architect needed to define the architecture of a system, including actively choosing abstractions, hierarchy, and a decomposition for the system.",
+    "lo.SA10": "Develop a personal set of guiding principles for successful architecting.",
+    "lo.SE01": "Understand fundamental principles and methods of engineering complex systems and how they may evolve in practice due to changes in enabling technological and organizational systems and context.",
+    "lo.SE02": "Elicit, define and formally articulate system value to help guide system priorities and structure value-generating activities across the system lifecycle.",
+    "lo.SE03": "Analyze, understand, and represent system behavior by defining and analyzing system missions, operations, modes, and use cases.",
+    "lo.SE04": "Define and manage requirements over the system’s lifecycle, tailoring the process to accommodate the system, its context, and emerging technologies and methods.",
+    "lo.SE05": "Define and systematically explore the system’s tradespace in order to optimally select amongst competing alternatives and objectives.",
+    "lo.SE06": "Define and manage the internal and external interfaces of a system given a particular choice of system boundary, architecture and decomposition.",
+    "lo.SE07": "Analyze and manage changes to the system over its lifecycle.",
+    "lo.SE08": "Understand the role of rigorous models of cyber-physical systems, formal modeling languages, and related approaches in the use of simulation and modeling in the system development process.",
+    "lo.SE09": "Plan and execute a system verification and validation program, including the design, analysis, and sequencing of appropriate experiments and test campaigns.",
+    "lo.SE10": "Understand the role of the system engineer in tailoring the system engineering approach to ensure maximum value delivery over the lifecycle of the system, including development, manufacturing, and operations.",
+    "lo.PM01": "Explore and define linkages between a project and the portfolio of an organization.",
+    "lo.PM02": "Define a project’s strategic purpose with estimates of systemic value, including metrics for verification.",
+    "lo.PM03": "Define a project charter in response to strategy and stakeholder views, including targets and priorities across cost, schedule, scope and risk.",
+    "lo.PM04": "Generate a project plan that is feasible given scope, resources, roles, dependencies, and risks.",
+    "lo.PM05": "Model a project as integrated product, process, and organizational systems. Leverage dynamic modeling to forecast emergent outcomes including rework.",
+    "lo.PM06": "Recommend a plan to stakeholders with a trade-space of alternatives across cost, schedule, scope, and risk.",
+    "lo.PM07": "Credibly challenge unrealistic expectations related to project cost, schedule, scope, and risk. Lead others to shift attention, analyze, learn, and adapt.",
+    "lo.PM08": "Establish a monitor and ongoing adaptive control approach including measures of value, scope progress, change, risk, cost, and other metrics.",
+    "lo.PM09": "Identify key skills and attitudes required for effective leadership and team readiness in systems development programs.",
+    "lo.PM10": "Design, select, and prepare project architecture and teamwork for diverse and geographically distributed projects."
+}
+
+# A subject whose similarity to an objective reaches this is counted as covering it
+COVERAGE_THRESHOLD = 0.4
+
+def objectives_version(objectives=LEARNING_OBJECTIVES):
+    text = "\n".join(f"{code}: {description}" for code, description in objectives.items())
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+def objectives_path(file_name, build=None):
+    return build_base(file_name, build) + '.objectives.npz'
+
+def normalize_code(code):
+    # "lo.SA01", "LO.SA01" and "SA01" all name the same objective
+    code = str(code).strip().upper()
+    return 'lo.' + (code[3:] if code.startswith('LO.') else code)
+
+class ObjectiveMatrix:
+    def __init__(self, codes, scores, version):
+        self.codes = list(codes)
+        self.scores = np.asarray(scores, dtype=np.float16)
+        self.version = version
+        self.rows = {code.upper(): i for i, code in enumerate(self.codes)}
+
+    @property
+    def size(self):
+        return self.scores.shape[1]
+
+    @classmethod
+    def build(cls, embeddings, objective_embeddings, objectives=LEARNING_OBJECTIVES, block_size=8192):
+        objective_embeddings = normalize_rows(objective_embeddings)
+        scores = np.empty((len(objectives), embeddings.shape[0]), dtype=np.float16)
+        for start in range(0, embeddings.shape[0], block_size):
+            scores[:, start:start + block_size] = objective_embeddings @ normalize_rows(embeddings[start:start + block_size]).T
+        return cls(list(objectives), scores, objectives_version(objectives))
+
+    def objective_row(self, code):
+        return self.rows.get(normalize_code(code).upper())
+
+    def top_rows(self, code, top_n=10, mask=None):
+        # (rows, scores) of the subjects most relevant to an objective, best first; None for an unknown code
+        objective = self.objective_row(code)
+        if objective is None:
+            return None
+        scores = self.scores[objective].astype(np.float32)
+        if mask is not None:
+            scores = np.where(mask, scores, -np.inf)
+        top_n = min(top_n, int(np.isfinite(scores).sum()))
+        rows = np.argpartition(-scores, top_n - 1)[:top_n] if top_n else np.zeros(0, dtype=np.int64)
+        rows = rows[np.argsort(-scores[rows], kind='stable')]
+        return rows, scores[rows]
+
+    def coverage(self, rows, threshold=COVERAGE_THRESHOLD):
+        # Per objective, the best of the given rows and its score, and whether it reaches the threshold
+        rows = np.asarray(rows, dtype=np.int64)
+        if rows.shape[0] == 0:
+            return np.full(len(self.codes), -1), np.zeros(len(self.codes), dtype=np.float32), np.zeros(len(self.codes), dtype=bool)
+        scores = self.scores[:, rows].astype(np.float32)
+        best = np.argmax(scores, axis=1)
+        best_scores = scores[np.arange(len(self.codes)), best]
+        return rows[best], best_scores, best_scores >= threshold
+
+    def save(self, file_name, build=None):
+        save_arrays(objectives_path(file_name, build), codes=np.asarray(self.codes), scores=self.scores, version=np.asarray(self.version))
+
+    @classmethod
+    def load(cls, file_name, build=None):
+        # None when missing or built for a different set of objectives
+        path = objectives_path(file_name, build)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            matrix = cls(data['codes'].tolist(), data['scores'], str(data['version']))
+        if matrix.version != objectives_version():
+            print("learning objectives changed since the build, recomputing their subject scores")
+            return None
+        return matrix
@@ -0,0 +1,66 @@
+import math
+import re
+from collections import Counter, defaultdict
+import numpy as np
+
+# In-memory inverted index with BM25 scoring over subject ids, titles and descriptions.
+# Per-posting BM25 weights are computed at build time, so a query only sums postings.
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:\.[a-z0-9]+)*")
+SUBJECT_ID_PATTERN = re.compile(r"^[A-Za-z0-9]{1,5}\.[A-Za-z0-9]{1,6}$")
+STOPWORDS = frozenset([
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'how', 'in', 'into', 'is', 'it',
+    'of', 'on', 'or', 'that', 'the', 'their', 'this', 'to', 'with', 'what', 'which', 'about',
+    'course', 'courses', 'subject', 'subjects', 'class', 'classes',
+])
+
+def tokenize(text):
+    return [token for token in TOKEN_PATTERN.findall(str(text).lower()) if token not in STOPWORDS]
+
+def parse_subject_ids(query):
+    # The subject ids in query when it consists only of ids (e.g. "16.332" or "EM.411, IDS.332"), otherwise []
+    parts = [part for part in re.split(r"[\s,;]+", query.strip()) if part]
+    if parts and all(SUBJECT_ID_PATTERN.match(part) for part in parts):
+        return [part.upper() for part in parts]
+    return []
+
+class LexicalIndex:
+    def __init__(self, documents, k1=1.5, b=0.75):
+        self.size = len(documents)
+        term_rows = defaultdict(list)
+        term_counts = defaultdict(list)
+        lengths = np.zeros(self.size, dtype=np.float32)
+        for row, document in enumerate(documents):
+            counts = Counter(tokenize(document))
+            lengths[row] = sum(counts.values())
+            for term, count in counts.items():
+                term_rows[term].append(row)
+                term_counts[term].append(count)
+
+        average_length = float(lengths.mean()) if self.size else 0.0
+        length_norm = k1 * (1 - b + b * lengths / max(average_length, 1e-9))
+        self.postings = {}
+        for term, rows in term_rows.items():
+            rows = np.asarray(rows, dtype=np.int32)
+            tf = np.asarray(term_counts[term], dtype=np.float32)
+            idf = math.log(1 + (self.size - len(rows) + 0.5) / (len(rows) + 0.5))
+            self.postings[term] = (rows, (idf * tf * (k1 + 1) / (tf + length_norm[rows])).astype(np.float32))
+
+    @classmethod
+    def from_catalog(cls, catalog):
+        # One document per searchable catalog row, aligned with the search engine rows.
+        # The title is repeated so title matches outweigh description matches.
+        documents = []
+        for row in catalog.search_rows:
+            title = catalog.titles[row]
+            documents.append(f"{catalog.ids[row]} {title} {title} {catalog.descriptions[row]}")
+        return cls(documents)
+
+    def scores(self, query):
+        # Dense BM25 scores over all rows, zero where no query term matches
+        scores = np.zeros(self.size, dtype=np.float32)
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is not None:
+                scores[posting[0]] += posting[1]
+        return scores
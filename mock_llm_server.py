@@ -0,0 +1,173 @@
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for the OpenAI chat completions endpoint. It replays scripted
+# tool-call / answer sequences with configurable latency, so the agent loop can be
+# exercised and benchmarked offline:
+#
+#   python mock_llm_server.py --port 8765 --latency 0.4
+#   OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=mock streamlit run app.py
+#
+# A script is a list of conversations, each a list of turns:
+#   {"user": "<user message>", "steps": [{"tool_calls": [{"name": ..., "arguments": {...}}]}, {"content": "..."}]}
+# The turn is chosen by the last user message, and the step by the number of assistant
+# messages sent after it.
+
+DEFAULT_SCRIPT = 'benchmark_conversations.json'
+FALLBACK_STEP = {"content": "I can help you explore MIT subjects. What are you interested in?"}
+
+def load_script(file_name):
+    with open(file_name, 'r', encoding='utf-8') as f:
+        conversations = json.load(f)
+    return {turn["user"].strip().lower(): turn["steps"] for conversation in conversations for turn in conversation}
+
+def message_field(message, name):
+    return message.get(name) if isinstance(message, dict) else None
+
+def pick_step(turns, messages, tool_choice):
+    last_user = max((i for i, message in enumerate(messages) if message_field(message, "role") == "user"), default=None)
+    if last_user is None:
+        return FALLBACK_STEP
+    steps = turns.get(str(message_field(messages[last_user], "content")).strip().lower())
+    if not steps:
+        return FALLBACK_STEP
+    step_index = sum(1 for message in messages[last_user + 1:] if message_field(message, "role") == "assistant")
+    if tool_choice == "none" or step_index >= len(steps):
+        # Past the script, or tools disabled: answer with the turn's final text
+        return next((step for step in reversed(steps) if "content" in step), FALLBACK_STEP)
+    return steps[step_index]
+
+def count_tokens(text):
+    # Rough estimate, good enough for usage numbers
+    return max(1, len(text) // 4)
+
+def script_tool_calls(step):
+    return [
+        {"id": "call_" + uuid.uuid4().hex[:12], "type": "function",
+         "function": {"name": call["name"], "arguments": json.dumps(call.get("arguments", {}))}}
+        for call in step.get("tool_calls", [])
+    ]
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    server_version = "MockLLM/1.0"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds * random.uniform(1 - self.server.jitter, 1 + self.server.jitter))
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self.send_error(404)
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        messages = request.get("messages", [])
+        step = pick_step(self.server.turns, messages, request.get("tool_choice"))
+        prompt_tokens = count_tokens(json.dumps(messages))
+        self.sleep(self.server.latency)
+        if request.get("stream"):
+            self.stream(request, step, prompt_tokens)
+        else:
+            self.respond(request, step, prompt_tokens)
+
+    def respond(self, request, step, prompt_tokens):
+        tool_calls = script_tool_calls(step)
+        content = step.get("content")
+        completion_tokens = count_tokens(content or json.dumps(tool_calls))
+        self.sleep(self.server.token_latency * completion_tokens)
+        body = json.dumps({
+            "id": "chatcmpl-mock-" + uuid.uuid4().hex[:12],
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "mock"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content, "tool_calls": tool_calls or None},
+                "finish_reason": "tool_calls" if tool_calls else "stop",
+            }],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def stream(self, request, step, prompt_tokens):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        completion_id = "chatcmpl-mock-" + uuid.uuid4().hex[:12]
+
+        def send(delta, finish_reason=None, usage=None):
+            chunk = {
+                "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                "model": request.get("model", "mock"),
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if usage is None else [],
+            }
+            if usage is not None:
+                chunk["usage"] = usage
+            self.wfile.write(b"data: " + json.dumps(chunk).encode('utf-8') + b"\n\n")
+            self.wfile.flush()
+
+        send({"role": "assistant", "content": ""})
+        tool_calls = script_tool_calls(step)
+        for index, tool_call in enumerate(tool_calls):
+            send({"tool_calls": [{"index": index, "id": tool_call["id"], "type": "function",
+                                  "function": {"name": tool_call["function"]["name"], "arguments": ""}}]})
+            arguments = tool_call["function"]["arguments"]
+            for start in range(0, len(arguments), 16):
+                self.sleep(self.server.token_latency)
+                send({"tool_calls": [{"index": index, "function": {"arguments": arguments[start:start + 16]}}]})
+        for word in (step.get("content") or "").split(" ") if not tool_calls else []:
+            self.sleep(self.server.token_latency)
+            send({"content": word + " "})
+        send({}, "tool_calls" if tool_calls else "stop")
+        if (request.get("stream_options") or {}).get("include_usage"):
+            completion_tokens = count_tokens(step.get("content") or json.dumps(tool_calls))
+            send(None, usage={"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                              "total_tokens": prompt_tokens + completion_tokens})
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+def create_server(script=DEFAULT_SCRIPT, host='127.0.0.1', port=8765, latency=0.0, token_latency=0.0, jitter=0.0, verbose=False):
+    server = ThreadingHTTPServer((host, port), MockLLMHandler)
+    server.daemon_threads = True
+    server.turns = load_script(script)
+    server.latency = latency
+    server.token_latency = token_latency
+    server.jitter = jitter
+    server.verbose = verbose
+    return server
+
+def start_in_background(**kwargs):
+    # Start a server on a daemon thread; returns it with its base URL in server.base_url
+    server = create_server(**kwargs)
+    threading.Thread(target=server.serve_forever, name="mock-llm-server", daemon=True).start()
+    host, port = server.server_address[:2]
+    server.base_url = f"http://{host}:{port}/v1"
+    return server
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Scripted stand-in for the OpenAI chat completions API")
+    parser.add_argument('--script', default=DEFAULT_SCRIPT)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.5, help="seconds before the first token")
+    parser.add_argument('--token-latency', type=float, default=0.01, help="seconds per generated token")
+    parser.add_argument('--jitter', type=float, default=0.2, help="relative random variation of the latencies")
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+    server = create_server(args.script, args.host, args.port, args.latency, args.token_latency, args.jitter, args.verbose)
+    print(f"Mock LLM server listening on http://{args.host}:{args.port}/v1")
+    server.serve_forever()
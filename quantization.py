@@ -0,0 +1,154 @@
+import argparse
+import os
+import time
+import numpy as np
+
+from embedding_store import build_base, load_store, replace_atomically
+
+# Quantized copies of the L2-normalized embedding matrix for search:
+#  - float16: half the memory of float32;
+#  - int8: a quarter, with a per-dimension scale so each dimension uses the full
+#    [-127, 127] range: x[i, j] ~= codes[i, j] * scale[j].
+# Scores are computed on the quantized matrix block by block, so only one block is
+# ever expanded to float32. For int8 the scale is folded into the query instead:
+# x . q ~= codes . (scale * q).
+
+DTYPES = ('float32', 'float16', 'int8')
+BLOCK_SIZE = 4096
+
+def quantized_paths(file_name, dtype, build=None):
+    # Named after the store build they were quantized from, so a copy is never paired
+    # with the matrix of another build
+    base = build_base(file_name, build) + '.' + dtype
+    return base + '.npy', base + '.scale.npy'
+
+def _normalized_blocks(matrix, block_size):
+    for start in range(0, matrix.shape[0], block_size):
+        block = np.asarray(matrix[start:start + block_size], dtype=np.float32)
+        norms = np.linalg.norm(block, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        yield start, block / norms
+
+class QuantizedMatrix:
+    def __init__(self, data, scale=None):
+        self.data = data
+        self.scale = None if scale is None else np.asarray(scale, dtype=np.float32)
+
+    @property
+    def dtype(self):
+        return self.data.dtype.name
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes + (self.scale.nbytes if self.scale is not None else 0)
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    @classmethod
+    def quantize(cls, matrix, dtype='int8', block_size=BLOCK_SIZE):
+        # Normalizes the rows, one block at a time so a memory-mapped source is never fully copied
+        if dtype not in DTYPES:
+            raise ValueError(f"Unknown embedding dtype {dtype}, expected one of {DTYPES}")
+        n, dim = matrix.shape if matrix.ndim == 2 else (matrix.shape[0], 0)
+        data = np.empty((n, dim), dtype=dtype)
+        scale = None
+        if dtype == 'int8':
+            max_abs = np.zeros(dim, dtype=np.float32)
+            for _, block in _normalized_blocks(matrix, block_size):
+                np.maximum(max_abs, np.abs(block).max(axis=0), out=max_abs)
+            scale = np.where(max_abs > 0, max_abs / 127, 1).astype(np.float32)
+        for start, block in _normalized_blocks(matrix, block_size):
+            if scale is not None:
+                block = np.clip(np.rint(block / scale), -127, 127)
+            data[start:start + block.shape[0]] = block
+        return cls(data, scale)
+
+    def take(self, rows):
+        return QuantizedMatrix(self.data[rows], self.scale)
+
+    def _queries(self, queries):
+        queries = np.asarray(queries, dtype=np.float32)
+        return queries * self.scale if self.scale is not None else queries
+
+    def dot(self, query, rows=None, block_size=BLOCK_SIZE):
+        # Scores of one normalized query against all rows, or against the given rows
+        query = self._queries(query)
+        data = self.data if rows is None else self.data[rows]
+        if data.dtype == np.float32:
+            return data @ query
+        scores = np.empty(data.shape[0], dtype=np.float32)
+        for start in range(0, data.shape[0], block_size):
+            scores[start:start + block_size] = data[start:start + block_size].astype(np.float32) @ query
+        return scores
+
+    def dot_batch(self, queries, block_size=BLOCK_SIZE):
+        # (n_queries, n_rows) scores, one expanded block of rows at a time
+        queries = self._queries(queries)
+        if self.data.dtype == np.float32:
+            return queries @ self.data.T
+        scores = np.empty((queries.shape[0], self.data.shape[0]), dtype=np.float32)
+        for start in range(0, self.data.shape[0], block_size):
+            scores[:, start:start + block_size] = queries @ self.data[start:start + block_size].astype(np.float32).T
+        return scores
+
+    def save(self, file_name, build=None):
+        matrix_path, scale_path = quantized_paths(file_name, self.dtype, build)
+        replace_atomically(matrix_path, lambda f: np.save(f, self.data))
+        if self.scale is not None:
+            replace_atomically(scale_path, lambda f: np.save(f, self.scale))
+
+    @classmethod
+    def load(cls, file_name, dtype, build=None):
+        # Memory-mapped, like the float32 store; None if this dtype was not built for this build
+        matrix_path, scale_path = quantized_paths(file_name, dtype, build)
+        if not os.path.exists(matrix_path) or (dtype == 'int8' and not os.path.exists(scale_path)):
+            return None
+        scale = np.load(scale_path) if dtype == 'int8' else None
+        return cls(np.load(matrix_path, mmap_mode='r'), scale)
+
+def save_quantized(embeddings, file_name, build=None, dtypes=('float16', 'int8')):
+    for dtype in dtypes:
+        QuantizedMatrix.quantize(embeddings, dtype).save(file_name, build)
+
+def evaluate_recall(embeddings, dtypes=('float16', 'int8'), n_queries=500, k=10, seed=42):
+    # recall@k of each quantized matrix against exact float32 search, using a sample of the
+    # subjects themselves, slightly perturbed, as queries
+    exact = QuantizedMatrix.quantize(embeddings, 'float32')
+    rng = np.random.default_rng(seed)
+    sample = rng.choice(len(exact), min(n_queries, len(exact)), replace=False)
+    queries = exact.data[np.sort(sample)] + rng.normal(0, 0.02, (len(sample), exact.shape[1])).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    k = min(k, len(exact))
+    truth = np.argpartition(-exact.dot_batch(queries), k - 1, axis=1)[:, :k]
+
+    report = {}
+    for dtype in ('float32',) + tuple(dtypes):
+        matrix = exact if dtype == 'float32' else QuantizedMatrix.quantize(embeddings, dtype)
+        start = time.perf_counter()
+        scores = matrix.dot_batch(queries)
+        elapsed = time.perf_counter() - start
+        found = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        recall = np.mean([len(np.intersect1d(a, b)) / k for a, b in zip(found, truth)])
+        report[dtype] = dict(recall=round(float(recall), 4), megabytes=round(matrix.nbytes / 2**20, 2),
+                             ms_per_query=round(elapsed * 1000 / len(queries), 3))
+    return report
+
+if __name__ == '__main__':
+    # python quantization.py full_embeddings [--build] [--queries 500]
+    parser = argparse.ArgumentParser(description="Quantized embedding matrices and their recall@10 against float32")
+    parser.add_argument('file_name', nargs='?', default='full_embeddings')
+    parser.add_argument('--build', action='store_true', help="write the float16 and int8 matrices next to the store")
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--k', type=int, default=10)
+    args = parser.parse_args()
+
+    meta, embeddings = load_store(args.file_name)
+    if args.build:
+        save_quantized(embeddings, args.file_name, meta.get('build'))
+    for dtype, row in evaluate_recall(embeddings, n_queries=args.queries, k=args.k).items():
+        print(f"{dtype:<8} recall@{args.k} {row['recall']:.4f}  {row['megabytes']:>8} MB  {row['ms_per_query']} ms/query")
@@ -0,0 +1,142 @@
+import atexit
+import hashlib
+import json
+import os
+import threading
+import time
+import numpy as np
+
+from embedding_store import replace_atomically
+from search_engine import normalize_rows
+
+# Semantic cache of advisor answers. An entry is served when the system prompt version
+# and catalog version match and the embedding of the new question is close enough to
+# the cached one. Entries expire after ttl seconds and the least recently used ones are
+# evicted beyond max_entries. Changes are written to local disk by a timer at most once
+# every save_delay seconds, and at exit; the file is written outside the lookup lock.
+
+def content_version(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+class ResponseCache:
+    def __init__(self, file_name='response_cache', max_entries=512, ttl=7 * 24 * 3600, similarity_threshold=0.93,
+                 save_delay=5.0):
+        self.file_name = file_name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.save_delay = save_delay
+        self.entries = []
+        self.embeddings = np.zeros((0, 0), dtype=np.float32)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        # Serializes the writers so an older snapshot never replaces a newer one
+        self._save_lock = threading.Lock()
+        self._dirty = False
+        self._timer = None
+        self.load()
+        atexit.register(self.flush)
+
+    @property
+    def paths(self):
+        return self.file_name + '.npy', self.file_name + '.json'
+
+    def load(self):
+        matrix_path, entries_path = self.paths
+        if not (os.path.exists(matrix_path) and os.path.exists(entries_path)):
+            return
+        try:
+            with open(entries_path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+            embeddings = np.load(matrix_path)
+        except (OSError, ValueError) as e:
+            print("Unable to load response cache:", str(e))
+            return
+        if len(entries) == embeddings.shape[0]:
+            self.entries, self.embeddings = entries, embeddings
+            self._expire(time.time())
+
+    def _schedule_save(self):
+        # Called with the lock held; the inserts made before the timer fires are written together
+        self._dirty = True
+        if self._timer is None:
+            self._timer = threading.Timer(self.save_delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        # Write the pending changes now
+        with self._save_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                if not self._dirty:
+                    return
+                self._dirty = False
+                # The matrix is replaced, never modified in place, so the reference is a snapshot
+                embeddings = self.embeddings
+                entries = json.dumps(self.entries).encode('utf-8')
+            matrix_path, entries_path = self.paths
+            try:
+                replace_atomically(matrix_path, lambda f: np.save(f, embeddings))
+                replace_atomically(entries_path, lambda f: f.write(entries))
+            except OSError as e:
+                print("Unable to save response cache:", str(e))
+
+    def _remove(self, keep):
+        keep = np.asarray(keep, dtype=bool)
+        self.evictions += int((~keep).sum())
+        self.entries = [entry for entry, kept in zip(self.entries, keep) if kept]
+        self.embeddings = self.embeddings[keep]
+
+    def _expire(self, now):
+        if self.entries:
+            self._remove([now - entry['created'] <= self.ttl for entry in self.entries])
+
+    def lookup(self, embedding, prompt_version, catalog_version):
+        # The cached entry for a similar question, or None
+        with self._lock:
+            now = time.time()
+            self._expire(now)
+            best = None
+            if self.entries:
+                scores = self.embeddings @ normalize_rows(embedding)
+                valid = np.array([entry['prompt_version'] == prompt_version and entry['catalog_version'] == catalog_version
+                                  for entry in self.entries])
+                scores = np.where(valid, scores, -1)
+                row = int(np.argmax(scores))
+                if scores[row] >= self.similarity_threshold:
+                    self.entries[row]['last_used'] = now
+                    # A copy, so callers cannot change the cached answer
+                    best = dict(self.entries[row], highlights=list(self.entries[row]['highlights']))
+            if best is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return best
+
+    def store(self, embedding, question, answer, highlights, prompt_version, catalog_version):
+        with self._lock:
+            now = time.time()
+            entry = dict(question=question, answer=answer, highlights=list(highlights), prompt_version=prompt_version,
+                         catalog_version=catalog_version, created=now, last_used=now)
+            vector = normalize_rows(np.asarray(embedding, dtype=np.float32).reshape(1, -1))
+            self.entries.append(entry)
+            self.embeddings = vector if not self.embeddings.size else np.concatenate([self.embeddings, vector])
+            self._expire(now)
+            if len(self.entries) > self.max_entries:
+                # Least recently used first out
+                order = np.argsort([entry['last_used'] for entry in self.entries], kind='stable')
+                keep = np.ones(len(self.entries), dtype=bool)
+                keep[order[:len(self.entries) - self.max_entries]] = False
+                self._remove(keep)
+            self._schedule_save()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return dict(size=len(self.entries), max_entries=self.max_entries, hits=self.hits, misses=self.misses,
+                        evictions=self.evictions, hit_rate=round(self.hits / lookups, 3) if lookups else 0.0)
@@ -0,0 +1,94 @@
+import numpy as np
+
+from quantization import QuantizedMatrix
+
+def normalize_rows(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1
+    return np.ascontiguousarray(matrix / norms, dtype=np.float32)
+
+def top_k(scores, top_n, threshold=None):
+    # Rows of the top_n highest scores (at or above threshold), best first
+    if threshold is None:
+        candidates = np.arange(scores.shape[0])
+    else:
+        candidates = np.flatnonzero(scores >= threshold)
+    if candidates.shape[0] > top_n:
+        keep = np.argpartition(-scores[candidates], top_n - 1)[:top_n]
+        candidates = candidates[keep]
+    rows = candidates[np.argsort(-scores[candidates], kind='stable')]
+    return rows, scores[rows]
+
+# Catalogs smaller than this are always searched exactly, even when an index is attached
+EXACT_SEARCH_MAX = 20000
+# Weight of the max-normalized BM25 score added to the cosine score in hybrid search
+LEXICAL_WEIGHT = 0.1
+# On large catalogs, at most this many top lexical hits are scored densely when there are that many hits
+LEXICAL_CANDIDATES = 2000
+
+class SearchEngine:
+    # Cosine search over an L2-normalized matrix built once at load time, float32 or quantized
+    # to float16/int8 (see quantization.py); embeddings may also be a prebuilt QuantizedMatrix.
+    # With an approximate index attached, large catalogs only score the index's candidate rows.
+    def __init__(self, embeddings, ids, index=None, exact_search_max=EXACT_SEARCH_MAX, dtype='float32'):
+        if not isinstance(embeddings, QuantizedMatrix):
+            embeddings = QuantizedMatrix.quantize(embeddings, dtype)
+        self.matrix = embeddings
+        self.ids = np.asarray(ids, dtype=object)
+        self.index = index
+        self.exact_search_max = exact_search_max
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def scores(self, query_embedding):
+        return self.matrix.dot(normalize_rows(query_embedding))
+
+    def use_index(self, exact=False):
+        return not exact and self.index is not None and len(self) > self.exact_search_max
+
+    def search_rows(self, query_embedding, top_n=10, threshold=None, nprobe=None, exact=False):
+        if not self.use_index(exact):
+            return top_k(self.scores(query_embedding), top_n, threshold)
+        query = normalize_rows(query_embedding)
+        candidates = self.index.candidates(query, nprobe)
+        rows, scores = top_k(self.matrix.dot(query, candidates), top_n, threshold)
+        return candidates[rows], scores
+
+    def _hybrid_candidates(self, query, lexical_scores, nprobe, lexical_candidates):
+        # Rows to score densely, or None for all rows
+        hits = np.flatnonzero(lexical_scores)
+        if len(self) > self.exact_search_max and hits.shape[0] >= lexical_candidates:
+            # Plenty of keyword hits: only score the best of them densely
+            return hits[np.argpartition(-lexical_scores[hits], lexical_candidates - 1)[:lexical_candidates]]
+        if self.use_index():
+            return self.index.candidates(query, nprobe)
+        return None
+
+    @staticmethod
+    def _fuse(dense, lexical_scores, candidates, top_n, threshold, lexical_weight):
+        # Rank by cosine + weighted BM25. The threshold still applies to the cosine score,
+        # so lexical matches reorder related subjects rather than admit unrelated ones.
+        lexical = lexical_scores if candidates is None else lexical_scores[candidates]
+        top_lexical = float(lexical.max()) if lexical.shape[0] else 0.0
+        fused = dense + lexical_weight * lexical / top_lexical if top_lexical > 0 else dense
+
+        valid = np.arange(dense.shape[0]) if threshold is None else np.flatnonzero(dense >= threshold)
+        rows, scores = top_k(fused[valid], top_n)
+        rows = valid[rows]
+        return (rows if candidates is None else candidates[rows]), scores
+
+    def hybrid_search_rows_batch(self, query_embeddings, lexical_scores, top_n=10, threshold=None, nprobe=None,
+                                 lexical_weight=LEXICAL_WEIGHT, lexical_candidates=LEXICAL_CANDIDATES):
+        # Queries that need a full scan share one matrix-matrix product
+        queries = normalize_rows(query_embeddings)
+        candidate_sets = [self._hybrid_candidates(query, scores, nprobe, lexical_candidates)
+                          for query, scores in zip(queries, lexical_scores)]
+        full_scan = [i for i, candidates in enumerate(candidate_sets) if candidates is None]
+        full_dense = dict(zip(full_scan, self.matrix.dot_batch(queries[full_scan]))) if full_scan else {}
+        results = []
+        for i, candidates in enumerate(candidate_sets):
+            dense = full_dense[i] if candidates is None else self.matrix.dot(queries[i], candidates)
+            results.append(self._fuse(dense, lexical_scores[i], candidates, top_n, threshold, lexical_weight))
+        return results
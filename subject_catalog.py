@@ -0,0 +1,106 @@
+import hashlib
+import sys
+import numpy as np
+
+from embedding_store import load_store
+
+SUBJECT_TYPES = ['Core', 'Eng & Mgmt Depth', 'Eng Depth', 'Mgmt Depth', 'Eng & Mgmt Elective', 'Eng Elective', 'Mgmt Elective', 'Other']
+TYPE_COLORS =   ['#0460D9', '#F2A413',        '#750014',   '#358C6C',    '#F2A413',             '#750014',      '#358C6C',       'gray']
+
+# Bits of SubjectCatalog.flags
+FLAG_CORE = 1
+FLAG_DEPTH = 2
+FLAG_ELECTIVE = 4
+FLAG_ENG = 8
+FLAG_MGMT = 16
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+def classify_types(core, depth, elect, eng, mgmt):
+    # Vectorized subject type codes, indexes into SUBJECT_TYPES
+    eng_mgmt = eng & mgmt
+    return np.select(
+        [core, depth & eng_mgmt, depth & eng, depth, elect & eng_mgmt, elect & eng, elect],
+        [0, 1, 2, 3, 4, 5, 6],
+        default=7,
+    ).astype(np.int8)
+
+class SubjectCatalog:
+    # Struct-of-arrays view of the embedding store, parsed once per process.
+    # Every store row is kept for the map; rows whose title repeats an earlier one
+    # are left out of search_rows and of the id index, as before.
+    def __init__(self, columns, matrix, build=None):
+        self.matrix = matrix
+        # Build id of the store the catalog was loaded from, None for stores without one
+        self.build = build
+        self.ids = [_intern(id) for id in columns['id']]
+        self.titles = [_intern(t) for t in columns['t']]
+        self.descriptions = [_intern(d) for d in columns['d']]
+        self.x = np.asarray(columns['x'], dtype=np.float32)
+        self.y = np.asarray(columns['y'], dtype=np.float32)
+        self.counts = np.asarray(columns['c'], dtype=np.int32)
+
+        core, depth, elect, eng, mgmt = (np.asarray(columns[key], dtype=bool) for key in ('core', 'depth', 'elect', 'eng', 'mgmt'))
+        self.flags = (core * FLAG_CORE | depth * FLAG_DEPTH | elect * FLAG_ELECTIVE | eng * FLAG_ENG | mgmt * FLAG_MGMT).astype(np.uint8)
+        self.type_codes = classify_types(core, depth, elect, eng, mgmt)
+
+        # Map marker size grows with the SDM count: 5 + round(log5(c)) * 3
+        self.sizes = (5 + np.round(np.log(np.maximum(self.counts, 1)) / np.log(5)) * 3).astype(np.int32)
+        self.colors = np.asarray(TYPE_COLORS, dtype=object)[self.type_codes]
+
+        seen_titles = set()
+        search_rows = []
+        self.index = {}
+        for row, (id, title) in enumerate(zip(self.ids, self.titles)):
+            if title in seen_titles:
+                continue
+            seen_titles.add(title)
+            search_rows.append(row)
+            self.index[id.upper()] = row
+        self.search_rows = np.asarray(search_rows, dtype=np.int64)
+        self._version = None
+
+    @property
+    def version(self):
+        # Content hash of the subjects, changes whenever a rebuild changes ids, titles or descriptions
+        if self._version is None:
+            digest = hashlib.sha256()
+            for id, title, description in zip(self.ids, self.titles, self.descriptions):
+                digest.update(f"{id}\0{title}\0{description}\n".encode('utf-8'))
+            self._version = digest.hexdigest()[:16]
+        return self._version
+
+    @classmethod
+    def load(cls, file_name):
+        meta, matrix = load_store(file_name)
+        return cls(meta['columns'], matrix, meta.get('build'))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, subject_id):
+        return subject_id.upper() in self.index
+
+    def row(self, subject_id):
+        return self.index.get(subject_id.upper())
+
+    def label(self, row):
+        return self.ids[row].upper() + ' ' + self.titles[row]
+
+    def info(self, row):
+        return f"Title: {self.ids[row]} {self.titles[row]}. Description: {self.descriptions[row]}"
+
+    @property
+    def search_ids(self):
+        return [self.ids[row] for row in self.search_rows]
+
+    def search_embeddings(self):
+        # The memory-mapped matrix itself when every row is searchable, otherwise a copy of the searchable rows
+        if len(self.search_rows) == len(self):
+            return self.matrix
+        return self.matrix[self.search_rows]
+
+    @property
+    def types(self):
+        return np.asarray(SUBJECT_TYPES, dtype=object)[self.type_codes]
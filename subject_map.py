@@ -0,0 +1,148 @@
+import numpy as np
+import streamlit as st
+from bokeh.models import ColumnDataSource, CustomJS, HoverTool, LabelSet, TapTool, WheelZoomTool
+from bokeh.plotting import figure
+
+from subject_catalog import SUBJECT_TYPES
+
+# The subject map. The per-type point columns are computed once per process and shared
+# by every session, and each session builds its figure once. st.bokeh_chart still
+# serializes the whole figure on every rerun: a rerun with unchanged highlights produces
+# an identical message, which Streamlit's message cache sends as a reference to the copy
+# the browser already holds, while a rerun that changes the highlights resends the figure.
+#
+# Catalogs with more than MAP_MAX_POINTS subjects are drawn reduced: the map is split
+# into REPRESENTATIVE_CELLS x REPRESENTATIVE_CELLS cells and only the subject with the
+# highest SDM count of each cell is plotted, over gray density bins of all subjects.
+# st.bokeh_chart is a static embed with no way to fetch points on zoom, so this bounds
+# what the browser receives and draws. Highlight labels are placed from the catalog, so
+# they also mark subjects that are not plotted.
+
+# Point columns kept per process: the current and the previous build of two catalog years
+MAP_COLUMNS_ENTRIES = 4
+MAP_MAX_POINTS = 5000
+REPRESENTATIVE_CELLS = 48
+DENSITY_CELLS = 32
+
+TOOLTIPS = """
+<div style="width:300px;">
+@id @title <br> <br>
+</div>
+"""
+
+TAP_CODE = """
+const data = labels.data
+for (const key in points) {
+    if (points[key].selected.indices.length > 0) {
+        const ind = points[key].selected.indices[0];
+        
+        const text = points[key].data.id[ind] + ' ' + points[key].data.title[ind];
+        if (!data.t.includes(text)) {
+            data.x.push(points[key].data.x[ind]);
+            data.y.push(points[key].data.y[ind]);
+            data.t.push(text);
+            data.ind.push(ind);                
+        }
+        window.open('https://student.mit.edu/catalog/search.cgi?search=' + points[key].data.id[ind], '_blank');
+        break;
+    }
+}
+labels.change.emit();
+"""
+
+def grid_cells(x, y, cells):
+    # Cell of each point in a cells x cells grid over the points' bounding box
+    def axis(values):
+        lo, hi = float(values.min()), float(values.max())
+        return np.clip(((values - lo) / max(hi - lo, 1e-6) * cells).astype(np.int64), 0, cells - 1)
+    return axis(y) * cells + axis(x)
+
+def representative_rows(x, y, counts, cells=REPRESENTATIVE_CELLS):
+    # Per non-empty cell, the row with the highest count, in row order
+    cell_ids = grid_cells(x, y, cells)
+    order = np.lexsort((-counts, cell_ids))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = cell_ids[order][1:] != cell_ids[order][:-1]
+    return np.sort(order[first])
+
+def density_bins(x, y, cells=DENSITY_CELLS):
+    # Rectangles of the non-empty cells, more opaque where more subjects fall
+    counts, x_edges, y_edges = np.histogram2d(x, y, bins=cells)
+    ix, iy = np.nonzero(counts)
+    filled = counts[ix, iy]
+    return dict(x=(x_edges[ix] + x_edges[ix + 1]) / 2, y=(y_edges[iy] + y_edges[iy + 1]) / 2,
+                width=np.full(len(filled), x_edges[1] - x_edges[0]), height=np.full(len(filled), y_edges[1] - y_edges[0]),
+                alpha=0.1 + 0.4 * np.log1p(filled) / np.log1p(filled.max()))
+
+@st.cache_resource(max_entries=MAP_COLUMNS_ENTRIES)
+def get_map_columns(year, build, version, _catalog):
+    # Point columns per subject type, as NumPy arrays so Bokeh ships them in binary form,
+    # and the density bins of a reduced map (None when every subject is plotted).
+    # Cached per catalog year and build: the version only hashes the subject texts, while
+    # a rebuild can also move points or change counts and flags. The catalog itself is
+    # not hashed; stores without builds are told apart by their version.
+    catalog = _catalog
+    ids = np.asarray(catalog.ids, dtype=object)
+    titles = np.asarray(catalog.titles, dtype=object)
+    types = catalog.types
+    shown = np.arange(len(catalog))
+    bins = None
+    if len(catalog) > MAP_MAX_POINTS:
+        shown = representative_rows(catalog.x, catalog.y, catalog.counts)
+        bins = density_bins(catalog.x, catalog.y)
+    columns = {}
+    for code, t in enumerate(SUBJECT_TYPES):
+        rows = shown[catalog.type_codes[shown] == code]
+        columns[t] = dict(x=catalog.x[rows], y=catalog.y[rows], id=ids[rows], title=titles[rows], type=types[rows],
+                          c=catalog.counts[rows], size=catalog.sizes[rows], color=catalog.colors[rows])
+    return dict(columns=columns, bins=bins, shown=len(shown), total=len(catalog))
+
+def build_map(map_data, height, output_backend="canvas"):
+    title = "UMAP projection of the embeddings of MIT subjects"
+    if map_data['bins'] is not None:
+        title += f" ({map_data['shown']} of {map_data['total']} shown, density in gray)"
+    p = figure(width=height, height=height, x_range=(-2, 12), y_range=(2, 15),
+               title=title, output_backend=output_backend)
+
+    labels = ColumnDataSource(data=dict(x=[], y=[], t=[], ind=[]))
+    p.add_layout(LabelSet(x='x', y='y', text='t', y_offset=5, x_offset=5, source=labels, text_font_size='8pt'))
+
+    if map_data['bins'] is not None:
+        p.rect('x', 'y', width='width', height='height', source=ColumnDataSource(data=map_data['bins']),
+               fill_color='gray', fill_alpha='alpha', line_color=None, level='underlay')
+
+    points = dict()
+    renderers = []
+    for t in SUBJECT_TYPES:
+        source = ColumnDataSource(data=dict(map_data['columns'][t]))
+        points[t] = source
+        if(t=='Core'):
+            renderers.append(p.square('x', 'y', size='size', source=source, alpha=0.8, legend_label=t, color='color'))
+        elif 'Depth' in t:
+            renderers.append(p.square('x', 'y', size='size', source=source, alpha=0.5, legend_label=t, color='color'))
+        elif 'Elective' in t:
+            renderers.append(p.triangle('x', 'y', size='size', source=source, alpha=0.5, legend_label=t, color='color'))
+        else:
+            renderers.append(p.circle('x', 'y', size='size', source=source, alpha=0.3, legend_label=t, color='color'))
+    p.legend.title = 'Subject Type'
+    p.legend.location = "top_left"
+    p.legend.click_policy="hide"
+
+    # Hover and tap only the subject points, not the density bins
+    p.add_tools(HoverTool(renderers=renderers, tooltips=TOOLTIPS))
+    callback=CustomJS(args=dict(points=points, labels=labels), code=TAP_CODE)
+    p.add_tools(TapTool(renderers=renderers, callback=callback))
+    # Enable zoom tool by default
+    p.toolbar.active_scroll = p.select_one(WheelZoomTool)
+    return p, labels
+
+def get_session_map(state, height, output_backend="canvas"):
+    # The session's figure and label source for a catalog state, rebuilt only when the
+    # catalog year or build, the size or the backend changes
+    key = (state.year, state.catalog.build, state.version, height, output_backend)
+    cached = st.session_state.get('subject_map')
+    if cached is None or cached[0] != key:
+        map_data = get_map_columns(state.year, state.catalog.build, state.version, state.catalog)
+        cached = (key, *build_map(map_data, height, output_backend))
+        st.session_state['subject_map'] = cached
+    return cached[1], cached[2]
@@ -0,0 +1,25 @@
+import os
+
+import numpy as np
+import pytest
+
+from embedding_store import records_to_columns, write_store
+
+def subject_columns(n):
+    return records_to_columns([dict(id=f'S.{i}', t=f'Subject {i}', d=f'About topic {i}', core=0, depth=0, elect=0,
+                                    eng=0, mgmt=0, c=0, x=float(i % 7), y=float(i % 5)) for i in range(n)])
+
+@pytest.fixture(scope='session')
+def agent(tmp_path_factory):
+    # The agent module, importing it against a small store in a scratch working directory.
+    # It loads its catalog relative to the working directory, which stays there for the session.
+    directory = tmp_path_factory.mktemp('agent')
+    write_store(subject_columns(50), np.random.default_rng(0).normal(size=(50, 8)), str(directory / 'full_embeddings'))
+    os.chdir(directory)
+    os.environ.setdefault("OPENAI_API_KEY", "test")
+    os.environ["TRACE_FILE"] = ""
+    import embedding_model
+    # No model download: tests that need embeddings stub them
+    embedding_model.warm_up_model = lambda background=True: None
+    import agent
+    return agent
@@ -0,0 +1,41 @@
+import numpy as np
+
+from ann_index import IVFIndex
+from search_engine import SearchEngine, normalize_rows
+
+def clustered_embeddings(n=6000, dim=32, clusters=60, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    return normalize_rows(centers[rng.integers(clusters, size=n)] + rng.normal(scale=0.6, size=(n, dim)))
+
+def recall_at_k(found, truth):
+    return np.mean([len(np.intersect1d(a, b)) / len(b) for a, b in zip(found, truth)])
+
+def test_ivf_recall_against_exact_search():
+    embeddings = clustered_embeddings()
+    rng = np.random.default_rng(1)
+    queries = normalize_rows(embeddings[rng.choice(len(embeddings), 200, replace=False)] + rng.normal(scale=0.05, size=(200, embeddings.shape[1])))
+    ids = np.arange(len(embeddings))
+    exact = SearchEngine(embeddings, ids)
+    approximate = SearchEngine(embeddings, ids, index=IVFIndex.build(embeddings), exact_search_max=0)
+
+    truth = [exact.search_rows(query, top_n=10)[0] for query in queries]
+    found = [approximate.search_rows(query, top_n=10)[0] for query in queries]
+    assert recall_at_k(found, truth) >= 0.9
+
+def test_ivf_lists_partition_the_rows():
+    embeddings = clustered_embeddings(n=1000)
+    index = IVFIndex.build(embeddings)
+    assert index.size == len(embeddings)
+    assert np.array_equal(np.sort(index.list_rows), np.arange(len(embeddings)))
+    # Probing every list scores every row
+    assert np.array_equal(np.sort(index.candidates(embeddings[0], nprobe=index.n_lists)), np.arange(len(embeddings)))
+
+def test_ivf_save_and_load(tmp_path):
+    embeddings = clustered_embeddings(n=500)
+    index = IVFIndex.build(embeddings)
+    file_name = str(tmp_path / 'store')
+    index.save(file_name)
+    loaded = IVFIndex.load(file_name)
+    assert np.array_equal(loaded.list_rows, index.list_rows)
+    assert np.allclose(loaded.centroids, index.centroids)
@@ -0,0 +1,20 @@
+import json
+import os
+import subprocess
+import sys
+
+PROBE = """
+import json, sys
+import api_server
+with open(sys.argv[1], 'w') as f:
+    json.dump(sorted(m for m in ('streamlit', 'bokeh') if m in sys.modules), f)
+"""
+
+def test_api_server_does_not_import_streamlit(agent, tmp_path):
+    # In a fresh interpreter, from the fixture's store directory. The result goes to a file:
+    # the modules print while importing.
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=root, OPENAI_API_KEY="test", TRACE_FILE="", MODEL_WARM_UP="0")
+    result = tmp_path / 'modules.json'
+    subprocess.run([sys.executable, '-c', PROBE, str(result)], capture_output=True, env=env, check=True)
+    assert json.loads(result.read_text()) == []
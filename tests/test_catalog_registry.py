@@ -0,0 +1,69 @@
+import numpy as np
+
+from ann_index import IVFIndex
+from catalog_registry import CatalogRegistry
+from conftest import subject_columns
+from embedding_store import StoreWriter
+from knn_graph import KNNGraph
+from quantization import save_quantized
+
+def build_store(file_name, n, sidecars=True):
+    embeddings = np.random.default_rng(n).normal(size=(n, 8)).astype(np.float32)
+    writer = StoreWriter(file_name, n)
+    writer.write(0, embeddings)
+    if sidecars:
+        # Saved under the new build before it is published, like create_embeddings does
+        IVFIndex.build(embeddings).save(file_name, writer.build)
+        KNNGraph.build(embeddings, k=5).save(file_name, writer.build)
+        save_quantized(embeddings, file_name, writer.build)
+    writer.commit(subject_columns(n))
+    return writer.build
+
+def test_hot_swap_never_pairs_a_store_with_files_of_another_build(tmp_path):
+    file_name = str(tmp_path / 'store')
+    first = build_store(file_name, 40)
+    registry = CatalogRegistry(files={'2025': file_name}, default_year='2025', check_interval=0)
+    old = registry.get()
+    assert old.catalog.build == first
+    assert old.knn_graph.size == 40 and old.search_engine.index.size == 40
+
+    # A rebuild without derived files: the new state must not use the first build's
+    second = build_store(file_name, 30, sidecars=False)
+    new = registry.get()
+    assert new is not old and new.catalog.build == second
+    assert new.knn_graph is None and new.search_engine.index is None
+    assert len(new.search_engine) == 30
+    # Turns holding the previous state finish on it
+    assert old.search_engine.search_rows(old.catalog.matrix[0], top_n=1)[0][0] == 0
+
+    # Files later added to the current build are picked up by the next check
+    KNNGraph.build(new.catalog.matrix, k=5).save(file_name, second)
+    latest = registry.get()
+    assert latest is not new and latest.knn_graph.size == 30
+    assert registry.get() is latest
+
+def test_diffs_do_not_keep_superseded_catalogs(tmp_path):
+    import gc
+    import weakref
+    from embedding_store import records_to_columns, write_store
+
+    def columns(titles):
+        return records_to_columns([dict(id=id, t=t, d='', core=0, depth=0, elect=0, eng=0, mgmt=0, c=0, x=0.0, y=0.0)
+                                   for id, t in titles.items()])
+    old_file, new_file = str(tmp_path / 'old'), str(tmp_path / 'new')
+    write_store(columns({'A.1': 'One', 'A.2': 'Two'}), np.ones((2, 4)), old_file)
+    write_store(columns({'A.2': 'Two, revised', 'A.3': 'Three'}), np.ones((2, 4)), new_file)
+    registry = CatalogRegistry(files={'2024': old_file, '2025': new_file}, default_year='2025', check_interval=0)
+
+    diff = registry.diff('2024', '2025')
+    assert (list(diff.added), list(diff.removed), list(diff.changed)) == (['A.3'], ['A.1'], ['A.2'])
+    assert diff.status('a.3') == 'added' and diff.status('A.9') == 'not found'
+    assert 'Two, revised' in diff.describe('A.2') and 'One' in diff.describe('A.1')
+    assert registry.diff('2024', '2025') is diff
+
+    superseded = weakref.ref(registry.get('2025').catalog)
+    write_store(columns({'A.2': 'Two', 'A.3': 'Three', 'A.4': 'Four'}), np.ones((3, 4)), new_file)
+    diff = registry.diff('2024', '2025')
+    assert list(diff.added) == ['A.3', 'A.4'] and not diff.changed
+    gc.collect()
+    assert superseded() is None
@@ -0,0 +1,51 @@
+from context_manager import ContextManager, as_dict
+
+SYSTEM = {"role": "system", "content": "You are an academic advisor."}
+
+def turn(i, tool_chars=2000):
+    return [
+        {"role": "user", "content": f"Question {i} about subjects"},
+        {"role": "assistant", "content": None, "tool_calls": [
+            {"id": f"call_{i}", "type": "function", "function": {"name": "find_related_subjects", "arguments": "{}"}}]},
+        {"role": "tool", "tool_call_id": f"call_{i}", "name": "find_related_subjects",
+         "content": f"Title: S.{i} Subject. Description: " + "x" * tool_chars},
+        {"role": "assistant", "content": f"Answer {i}"},
+    ]
+
+def conversation(turns):
+    messages = [SYSTEM]
+    for i in range(turns):
+        messages.extend(turn(i))
+    return messages
+
+def test_context_stays_within_budget_including_the_dropped_turns_note():
+    manager = ContextManager(token_budget=2000, keep_recent_turns=2)
+    for turns in range(1, 30):
+        context = manager.prepare(conversation(turns))
+        assert manager.count(context) <= manager.token_budget, turns
+
+def test_dropped_turns_are_summarized_and_the_prefix_is_kept():
+    manager = ContextManager(token_budget=2000, keep_recent_turns=2)
+    messages = conversation(20)
+    context = manager.prepare(messages)
+    assert context[0] is SYSTEM
+    assert context[1]["role"] == "system" and "Question 0" in context[1]["content"]
+    # The latest turns are sent in full
+    assert context[-8:] == messages[-8:]
+    # The history itself is untouched
+    assert len(messages) == 1 + 20 * 4
+
+def test_tool_results_stay_paired_with_their_calls():
+    manager = ContextManager(token_budget=2000, keep_recent_turns=2)
+    context = [as_dict(message) for message in manager.prepare(conversation(20))]
+    call_ids = [call["id"] for message in context for call in message.get("tool_calls") or []]
+    result_ids = [message["tool_call_id"] for message in context if message["role"] == "tool"]
+    assert call_ids == result_ids
+    for i, message in enumerate(context):
+        if message["role"] == "tool":
+            assert context[i - 1].get("tool_calls"), "a tool result must follow its assistant message"
+
+def test_recent_turns_within_budget_are_sent_unchanged():
+    manager = ContextManager(keep_recent_turns=2)
+    messages = conversation(2)
+    assert manager.prepare(messages) == messages
@@ -0,0 +1,25 @@
+from openpyxl import Workbook
+
+from create_embeddings import read_subjects
+
+HEADER = ['SUBJECT_ID', 'SUBJECT_TITLE', 'isDepth', 'isElective', 'engUnits', 'mgmtUnits', 'SUBJECT_DESCRIPTION']
+
+def write_catalog(path, header, rows):
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(header)
+    for row in rows:
+        sheet.append(row)
+    workbook.save(path)
+
+def test_catalog_without_sdm_counts(tmp_path):
+    # Like the 2024 catalog: no SDMCount column and stray cells below the table
+    path = str(tmp_path / 'catalog.xlsx')
+    write_catalog(path, HEADER, [
+        ['EM.411', 'Foundations', 'N', 'N', 6, 6, 'Core subject'],
+        ['16.842', 'Systems Engineering', 'Y', 'N', 12, 0, 'Depth subject'],
+        [None, None, None, 'Y', 12, 0, None],
+    ])
+    data = read_subjects(path, chunk_size=2)
+    assert list(data['SUBJECT_ID']) == ['16.842', 'EM.411']
+    assert list(data['SDMCount']) == [0, 0]
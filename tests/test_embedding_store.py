@@ -0,0 +1,41 @@
+import os
+
+import numpy as np
+
+from embedding_store import StoreWriter, read_meta, read_store, records_to_columns, save_arrays, write_store
+
+def columns(n):
+    return records_to_columns([dict(id=f'S.{i}', t=f'Subject {i}', d='', core=0, depth=0, elect=0, eng=0, mgmt=0,
+                                    c=0, x=0.0, y=0.0) for i in range(n)])
+
+def test_rebuild_publishes_a_new_build_without_touching_the_mapped_one(tmp_path):
+    file_name = str(tmp_path / 'store')
+    first = write_store(columns(3), np.ones((3, 4)), file_name)
+    _, mapped = read_store(file_name)
+
+    writer = StoreWriter(file_name, 3)
+    writer.write(0, np.full((3, 4), 2.0))
+    writer.commit(columns(3))
+
+    assert read_meta(file_name)['build'] == writer.build != first
+    assert read_store(file_name)[1].sum() == 24
+    # The earlier mapping still reads the first build
+    assert mapped.sum() == 12
+    assert sorted(os.listdir(tmp_path)) == sorted(['store.meta.json', f'store.{writer.build}.npy'])
+
+def test_files_of_a_store_without_builds_are_replaced(tmp_path):
+    file_name = str(tmp_path / 'store')
+    for suffix in ('.npy', '.int8.npy', '.ivf.npz'):
+        (tmp_path / ('store' + suffix)).write_bytes(b'')
+    (tmp_path / 'store.umap.pkl').write_bytes(b'')
+    (tmp_path / 'store.embedding_cache.npy').write_bytes(b'')
+    build = write_store(columns(2), np.ones((2, 4)), file_name)
+    assert sorted(os.listdir(tmp_path)) == sorted(['store.meta.json', f'store.{build}.npy', 'store.embedding_cache.npy'])
+
+def test_save_arrays_leaves_no_temporary_file(tmp_path):
+    path = str(tmp_path / 'store.ivf.npz')
+    save_arrays(path, rows=np.arange(5), scores=np.ones(5, dtype=np.float16))
+    with np.load(path) as data:
+        assert np.array_equal(data['rows'], np.arange(5))
+        assert data['scores'].dtype == np.float16
+    assert os.listdir(tmp_path) == ['store.ivf.npz']
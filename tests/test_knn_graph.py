@@ -0,0 +1,20 @@
+import numpy as np
+
+from ann_index import IVFIndex
+from knn_graph import KNNGraph
+from test_ann_index import clustered_embeddings, recall_at_k
+
+def test_exact_graph_matches_brute_force():
+    embeddings = clustered_embeddings(n=300)
+    graph = KNNGraph.build(embeddings, k=5, block_size=64)
+    scores = embeddings @ embeddings.T
+    np.fill_diagonal(scores, -np.inf)
+    assert np.array_equal(graph.neighbors, np.argsort(-scores, axis=1)[:, :5])
+
+def test_graph_from_ivf_index_recall_against_exact():
+    embeddings = clustered_embeddings()
+    exact = KNNGraph.build(embeddings, k=10)
+    approximate = KNNGraph.build(embeddings, k=10, index=IVFIndex.build(embeddings), exact_max_rows=0)
+    assert recall_at_k(approximate.neighbors, exact.neighbors) >= 0.9
+    # No subject is its own neighbour
+    assert not (approximate.neighbors == np.arange(len(embeddings))[:, None]).any()
@@ -0,0 +1,55 @@
+import numpy as np
+
+from lexical_index import LexicalIndex, parse_subject_ids, tokenize
+
+DOCUMENTS = [
+    "EM.411 Foundations of System Design and Management",
+    "16.842 Fundamentals of Systems Engineering systems engineering",
+    "15.390 New Enterprises and entrepreneurship in technology ventures and markets",
+    "IDS.332 Engineering Economics and Finance",
+]
+
+def ranking(index, query):
+    scores = index.scores(query)
+    return [int(row) for row in np.argsort(-scores, kind='stable') if scores[row] > 0]
+
+def test_tokens_keep_subject_ids_and_drop_stopwords():
+    assert tokenize("The subjects about EM.411 and Systems-Engineering") == ['em.411', 'systems', 'engineering']
+
+def test_bm25_ranks_by_term_frequency_and_rarity():
+    index = LexicalIndex(DOCUMENTS)
+    # Both match "engineering"; the repeated term ranks 16.842 first
+    assert ranking(index, "engineering") == [1, 3]
+    # "finance" occurs once in the collection, so it outweighs the common "engineering"
+    assert ranking(index, "engineering finance") == [3, 1]
+    assert ranking(index, "EM.411") == [0]
+    assert not index.scores("the of and").any()
+
+def test_longer_documents_score_lower_for_the_same_match():
+    index = LexicalIndex(["design", "design of complex engineered products and services"])
+    scores = index.scores("design")
+    assert scores[0] > scores[1] > 0
+
+def test_parse_subject_ids_only_accepts_queries_made_of_ids():
+    assert parse_subject_ids("16.332") == ['16.332']
+    assert parse_subject_ids(" em.411, IDS.332; 15.390 ") == ['EM.411', 'IDS.332', '15.390']
+    assert parse_subject_ids("EM.411 systems") == []
+    assert parse_subject_ids("system design") == []
+    assert parse_subject_ids("") == []
+
+def test_id_queries_are_looked_up_without_search(agent, monkeypatch):
+    encoded = []
+    def embed_queries(queries):
+        encoded.extend(queries)
+        return [np.ones(8, dtype=np.float32) for _ in queries]
+    monkeypatch.setattr(agent, 'embed_queries', embed_queries)
+
+    results = agent.find_related_subjects_batch(["S.3, S.7", "topic 12", "S.5"])
+    assert results[0] == agent.get_subject_info(['S.3', 'S.7'])
+    assert results[2] == agent.get_subject_info(['S.5'])
+    # Only the free-text query is encoded and searched
+    assert encoded == ["topic 12"]
+
+    # Ids missing from the catalog fall through to the hybrid search
+    agent.find_related_subjects("XX.999")
+    assert encoded == ["topic 12", "XX.999"]
@@ -0,0 +1,25 @@
+import pytest
+from tenacity import wait_none
+
+class FailingCompletions:
+    def __init__(self):
+        self.calls = 0
+
+    def create(self, **kwargs):
+        self.calls += 1
+        raise ConnectionError("model unavailable")
+
+@pytest.mark.parametrize('request_name', ['chat_completion_request', 'chat_completion_stream'])
+def test_model_errors_are_retried_then_raised(agent, monkeypatch, request_name):
+    completions = FailingCompletions()
+    monkeypatch.setattr(agent.client.chat, 'completions', completions)
+    request = getattr(agent, request_name).retry_with(wait=wait_none())
+    with pytest.raises(ConnectionError):
+        request([{"role": "user", "content": "hi"}])
+    assert completions.calls == 3
+
+def test_a_failed_turn_raises_instead_of_reading_the_error(agent, monkeypatch):
+    monkeypatch.setattr(agent.client.chat, 'completions', FailingCompletions())
+    monkeypatch.setattr(agent, 'chat_completion_request', agent.chat_completion_request.retry_with(wait=wait_none()))
+    with pytest.raises(ConnectionError):
+        agent.run_assistant_rounds([{"role": "user", "content": "hi"}])
@@ -0,0 +1,29 @@
+import numpy as np
+
+from catalog_registry import CatalogState
+from conftest import subject_columns
+from embedding_store import write_store
+from quantization import QuantizedMatrix, evaluate_recall, save_quantized
+from test_ann_index import clustered_embeddings
+
+def test_quantized_recall_against_exact_search():
+    report = evaluate_recall(clustered_embeddings(n=3000, dim=64), n_queries=200)
+    assert report['float32']['recall'] == 1.0
+    assert report['float16']['recall'] >= 0.99
+    assert report['int8']['recall'] >= 0.9
+    assert report['int8']['megabytes'] < report['float32']['megabytes'] / 3
+
+def test_copies_of_another_build_are_not_used(tmp_path):
+    file_name = str(tmp_path / 'store')
+    first = write_store(subject_columns(20), np.ones((20, 8)), file_name)
+    save_quantized(np.ones((20, 8)), file_name, first)
+    assert QuantizedMatrix.load(file_name, 'int8', first) is not None
+
+    rng = np.random.default_rng(0)
+    embeddings = rng.normal(size=(20, 8))
+    second = write_store(subject_columns(20), embeddings, file_name)
+    assert QuantizedMatrix.load(file_name, 'int8', second) is None
+    # Without copies of its own build the state quantizes the new matrix at load time
+    state = CatalogState('2025', file_name)
+    expected = QuantizedMatrix.quantize(embeddings, 'int8')
+    assert np.array_equal(state.search_engine.matrix.data, expected.data)
@@ -0,0 +1,91 @@
+import os
+
+import numpy as np
+
+import response_cache
+from response_cache import ResponseCache
+
+def vector(*values):
+    return np.array(values, dtype=np.float32)
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+def new_cache(tmp_path, monkeypatch, **kwargs):
+    clock = Clock()
+    monkeypatch.setattr(response_cache.time, 'time', clock)
+    return ResponseCache(file_name=str(tmp_path / 'responses'), save_delay=3600, **kwargs), clock
+
+def store(cache, embedding, question):
+    cache.store(embedding, question, f"answer to {question}", ['EM.411'], 'p1', 'c1')
+
+def test_lookup_matches_similar_questions_of_the_same_versions(tmp_path, monkeypatch):
+    cache, _ = new_cache(tmp_path, monkeypatch, similarity_threshold=0.9)
+    store(cache, vector(1, 0, 0), "systems design")
+
+    assert cache.lookup(vector(1, 0.2, 0), 'p1', 'c1')['question'] == "systems design"
+    # cos = 0.8, below the threshold
+    assert cache.lookup(vector(0.8, 0.6, 0), 'p1', 'c1') is None
+    assert cache.lookup(vector(1, 0, 0), 'p2', 'c1') is None
+    assert cache.lookup(vector(1, 0, 0), 'p1', 'c2') is None
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 3
+
+def test_lookup_returns_a_copy(tmp_path, monkeypatch):
+    cache, _ = new_cache(tmp_path, monkeypatch)
+    store(cache, vector(1, 0, 0), "systems design")
+
+    entry = cache.lookup(vector(1, 0, 0), 'p1', 'c1')
+    entry['answer'] = "changed"
+    entry['highlights'].append('16.842')
+    entry = cache.lookup(vector(1, 0, 0), 'p1', 'c1')
+    assert entry['answer'] == "answer to systems design"
+    assert entry['highlights'] == ['EM.411']
+
+def test_entries_expire_after_the_ttl(tmp_path, monkeypatch):
+    cache, clock = new_cache(tmp_path, monkeypatch, ttl=60)
+    store(cache, vector(1, 0, 0), "systems design")
+
+    clock.now += 60
+    assert cache.lookup(vector(1, 0, 0), 'p1', 'c1') is not None
+    clock.now += 1
+    assert cache.lookup(vector(1, 0, 0), 'p1', 'c1') is None
+    assert cache.stats()['size'] == 0 and cache.stats()['evictions'] == 1
+
+def test_least_recently_used_entry_is_evicted(tmp_path, monkeypatch):
+    cache, clock = new_cache(tmp_path, monkeypatch, max_entries=2)
+    store(cache, vector(1, 0, 0), "first")
+    clock.now += 1
+    store(cache, vector(0, 1, 0), "second")
+    clock.now += 1
+    assert cache.lookup(vector(1, 0, 0), 'p1', 'c1')['question'] == "first"
+    clock.now += 1
+    store(cache, vector(0, 0, 1), "third")
+
+    assert [entry['question'] for entry in cache.entries] == ["first", "third"]
+    assert cache.lookup(vector(0, 1, 0), 'p1', 'c1') is None
+    assert cache.stats()['evictions'] == 1
+
+def test_inserts_are_saved_together_and_reloaded(tmp_path, monkeypatch):
+    cache, _ = new_cache(tmp_path, monkeypatch)
+    store(cache, vector(1, 0, 0), "first")
+    store(cache, vector(0, 1, 0), "second")
+    # Nothing is written until the timer fires or the cache is flushed
+    assert os.listdir(tmp_path) == []
+    cache.flush()
+    assert sorted(os.listdir(tmp_path)) == ['responses.json', 'responses.npy']
+
+    reloaded, _ = new_cache(tmp_path, monkeypatch)
+    assert [entry['question'] for entry in reloaded.entries] == ["first", "second"]
+    assert reloaded.lookup(vector(0, 1, 0), 'p1', 'c1')['answer'] == "answer to second"
+
+def test_pending_changes_are_written_by_the_timer(tmp_path, monkeypatch):
+    cache, _ = new_cache(tmp_path, monkeypatch)
+    cache.save_delay = 0.01
+    store(cache, vector(1, 0, 0), "first")
+    cache._timer.join(5)
+    assert sorted(os.listdir(tmp_path)) == ['responses.json', 'responses.npy']
+    assert cache._timer is None
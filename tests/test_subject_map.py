@@ -0,0 +1,49 @@
+import numpy as np
+
+from catalog_registry import CatalogRegistry
+from conftest import subject_columns
+from embedding_store import write_store
+import subject_map
+from embedding_store import records_to_columns
+from subject_catalog import SubjectCatalog
+from subject_map import build_map, get_map_columns
+
+def test_map_columns_follow_a_rebuild_with_the_same_subjects(tmp_path):
+    file_name = str(tmp_path / 'store')
+    embeddings = np.random.default_rng(0).normal(size=(10, 8))
+    write_store(subject_columns(10), embeddings, file_name)
+    registry = CatalogRegistry(files={'2025': file_name}, default_year='2025', check_interval=0)
+    old = registry.get()
+
+    # Same texts, a refitted layout
+    moved = subject_columns(10)
+    moved['x'] = [x + 100.0 for x in moved['x']]
+    write_store(moved, embeddings, file_name)
+    new = registry.get()
+    assert new.version == old.version and new.catalog.build != old.catalog.build
+
+    columns = get_map_columns(new.year, new.catalog.build, new.version, new.catalog)['columns']
+    assert np.array_equal(np.sort(columns['Other']['x']), np.sort(np.asarray(moved['x'], dtype=np.float32)))
+
+def test_large_catalogs_plot_one_representative_per_cell(monkeypatch):
+    monkeypatch.setattr(subject_map, 'MAP_MAX_POINTS', 500)
+    rng = np.random.default_rng(0)
+    n = 3000
+    columns = records_to_columns([dict(id=f'S.{i}', t=f'Subject {i}', d='', core=0, depth=int(i % 5 == 0), elect=0,
+                                       eng=i % 2, mgmt=0, c=int(rng.integers(0, 50)), x=float(rng.normal()), y=float(rng.normal()))
+                                  for i in range(n)])
+    catalog = SubjectCatalog(columns, np.zeros((n, 4), dtype=np.float32))
+    map_data = get_map_columns('test', 'reduced', catalog.version, catalog)
+
+    shown = np.concatenate([map_data['columns'][t]['id'] for t in map_data['columns']])
+    rows = np.array([catalog.index[id] for id in shown])
+    cells = subject_map.grid_cells(catalog.x, catalog.y, subject_map.REPRESENTATIVE_CELLS)
+    # One subject per non-empty cell, the most taken one
+    assert map_data['shown'] == len(rows) == len(np.unique(cells))
+    assert np.array_equal(np.sort(cells[rows]), np.unique(cells))
+    best = {cell: catalog.counts[cells == cell].max() for cell in np.unique(cells)}
+    assert all(catalog.counts[row] == best[cells[row]] for row in rows)
+    # The density bins cover every subject
+    assert 0 < len(map_data['bins']['x']) <= subject_map.DENSITY_CELLS ** 2
+    p, labels = build_map(map_data, 500)
+    assert f"{len(rows)} of {n} shown" in p.title.text
@@ -0,0 +1,41 @@
+import json
+
+from openai.types.chat import ChatCompletionMessageToolCall
+from openai.types.chat.chat_completion_message_tool_call import Function
+
+def tool_call(id, name, arguments):
+    return ChatCompletionMessageToolCall(id=id, type='function', function=Function(name=name, arguments=json.dumps(arguments)))
+
+def stub_tools(agent, monkeypatch):
+    batches = []
+    def run_search_batch(queries):
+        batches.append(list(queries))
+        return [f"found {query}" for query in queries]
+    monkeypatch.setattr(agent, 'run_search_batch', run_search_batch)
+    monkeypatch.setitem(agent.TOOL_FUNCTIONS, 'get_subject_info', lambda subject_ids: "info " + " ".join(subject_ids))
+    return batches
+
+CALLS = [
+    tool_call('1', 'find_related_subjects', {'query': 'alpha'}),
+    tool_call('2', 'get_subject_info', {'subject_ids': ['S.1']}),
+    tool_call('3', 'find_related_subjects', {'query': 'beta'}),
+]
+
+def test_searches_of_a_message_share_one_batch(agent, monkeypatch):
+    batches = stub_tools(agent, monkeypatch)
+    assert agent.run_tool_calls(CALLS) == ['found alpha', 'info S.1', 'found beta']
+    assert batches == [['alpha', 'beta']]
+
+def test_streamed_calls_batch_searches_at_finish(agent, monkeypatch):
+    batches = stub_tools(agent, monkeypatch)
+    runner = agent.ToolCallRunner()
+    for call in CALLS:
+        runner.start(call)
+    assert batches == []
+    assert runner.finish(CALLS) == ['found alpha', 'info S.1', 'found beta']
+    assert batches == [['alpha', 'beta']]
+
+def test_invalid_calls_get_an_error_result(agent, monkeypatch):
+    stub_tools(agent, monkeypatch)
+    calls = [tool_call('1', 'no_such_tool', {}), tool_call('2', 'get_subject_info', {})]
+    assert agent.run_tool_calls(calls) == ["Error: function does not exist", "Error: invalid function arguments"]
@@ -0,0 +1,40 @@
+import json
+import os
+
+from tracing import Span, TraceExporter, Tracer
+
+def finished_span(name):
+    s = Span(name, attributes=dict(query="x" * 50))
+    s.duration_ms = 1.0
+    return s
+
+def test_export_is_opt_in():
+    tracer = Tracer(file_name="")
+    tracer.record(finished_span("search"))
+    assert tracer.exporter is None
+    assert tracer.summary()["search"]["count"] == 1
+
+def test_exporter_appends_and_rotates(tmp_path):
+    file_name = str(tmp_path / "traces.jsonl")
+    tracer = Tracer(file_name=file_name)
+    tracer.exporter.max_bytes = 1000
+    for i in range(30):
+        tracer.record(finished_span(f"span{i}"))
+    tracer.close()
+
+    assert sorted(os.listdir(tmp_path)) == ["traces.jsonl", "traces.jsonl.1"]
+    assert os.path.getsize(file_name + ".1") >= 1000
+    with open(file_name + ".1") as f:
+        rotated = [json.loads(line)["name"] for line in f]
+    with open(file_name) as f:
+        current = [json.loads(line)["name"] for line in f]
+    # The newest spans are in the current file, in order
+    assert current == [f"span{i}" for i in range(30 - len(current), 30)]
+    assert rotated == [f"span{i}" for i in range(30 - len(current) - len(rotated), 30 - len(current))]
+
+def test_exporter_drops_spans_when_the_queue_is_full(tmp_path):
+    exporter = TraceExporter(str(tmp_path / "traces.jsonl"), queue_size=1)
+    exporter.close()
+    exporter.export({})
+    exporter.export({})
+    assert exporter.dropped == 1
@@ -0,0 +1,233 @@
+import atexit
+import bisect
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+
+# Lightweight tracing for the app and the agent hot path.
+#
+# span(name, **attributes) times a block, nests under the enclosing span of the same
+# context and updates the in-process latency histogram of that name. Setting TRACE_FILE
+# also exports every span to that JSONL file: a background thread keeps the file open
+# and appends the spans queued by the request threads, and when the file grows past
+# TRACE_MAX_BYTES it is renamed to <TRACE_FILE>.1, replacing the previous one. Spans
+# are dropped, and counted, while the queue is full.
+#
+# stage(name) is the cheaper variant for tight loops: it only adds its duration to the
+# stage collector bound with collect_stages(), which the benchmarks use to attribute
+# time to one turn. Spans report to the collector too, under their name.
+#
+# Work submitted with submit_in_context keeps the submitter's span and collector.
+
+TRACE_FILE = os.environ.get("TRACE_FILE", "")
+TRACE_MAX_BYTES = int(os.environ.get("TRACE_MAX_BYTES", 50 * 1024 * 1024))
+TRACE_QUEUE_SIZE = 10000
+RECENT_SPANS = 200
+
+# Upper bounds of the histogram buckets, in milliseconds
+BUCKET_BOUNDS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000, 60000]
+
+_collector = ContextVar('stage_collector', default=None)
+_current_span = ContextVar('current_span', default=None)
+
+class StageTimings:
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.seconds[name] += seconds
+
+    def as_dict(self):
+        with self._lock:
+            return dict(self.seconds)
+
+class LatencyHistogram:
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, ms):
+        self.buckets[bisect.bisect_left(BUCKET_BOUNDS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, p):
+        # Upper bound of the bucket holding the p-th percentile
+        if not self.count:
+            return 0.0
+        rank = p / 100 * self.count
+        seen = 0
+        for bound, count in zip(BUCKET_BOUNDS_MS + [self.max_ms], self.buckets):
+            seen += count
+            if seen >= rank:
+                return float(min(bound, self.max_ms))
+        return self.max_ms
+
+    def summary(self):
+        return dict(count=self.count, mean_ms=round(self.total_ms / self.count, 2) if self.count else 0.0,
+                    p50_ms=self.percentile(50), p95_ms=self.percentile(95), p99_ms=self.percentile(99),
+                    max_ms=round(self.max_ms, 2))
+
+class Span:
+    def __init__(self, name, parent=None, attributes=None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent is not None else uuid.uuid4().hex[:16]
+        self.span_id = uuid.uuid4().hex[:8]
+        self.parent_id = parent.span_id if parent is not None else None
+        self.attributes = dict(attributes or {})
+        self.start = time.time()
+        self.duration_ms = None
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def as_dict(self):
+        return dict(name=self.name, trace_id=self.trace_id, span_id=self.span_id, parent_id=self.parent_id,
+                    start=round(self.start, 6), duration_ms=round(self.duration_ms or 0.0, 3),
+                    attributes=self.attributes, error=self.error)
+
+class TraceExporter:
+    # Appends span records to a JSONL file from a background thread
+    def __init__(self, file_name, max_bytes=TRACE_MAX_BYTES, queue_size=TRACE_QUEUE_SIZE):
+        self.file_name = file_name
+        self.max_bytes = max_bytes
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._file = None
+        self._size = 0
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, record):
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self, timeout=5):
+        # Write the queued spans and stop the thread
+        if not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+    def _run(self):
+        try:
+            self._open()
+            while True:
+                record = self._queue.get()
+                if record is None:
+                    break
+                # json.dumps escapes non-ASCII characters, so the length is the size in bytes
+                line = json.dumps(record, default=str) + "\n"
+                self._file.write(line)
+                self._size += len(line)
+                if self._size >= self.max_bytes:
+                    self._file.close()
+                    os.replace(self.file_name, self.file_name + '.1')
+                    self._open()
+                elif self._queue.empty():
+                    self._file.flush()
+        except OSError as e:
+            print("Unable to write trace:", str(e))
+        finally:
+            if self._file is not None:
+                self._file.close()
+
+    def _open(self):
+        self._file = open(self.file_name, 'a', encoding='utf-8')
+        self._size = self._file.tell()
+
+class Tracer:
+    # Histograms per span name, the most recent spans and the optional JSONL exporter
+    def __init__(self, file_name=TRACE_FILE, recent=RECENT_SPANS):
+        self.exporter = TraceExporter(file_name) if file_name else None
+        self.histograms = defaultdict(LatencyHistogram)
+        self.recent = deque(maxlen=recent)
+        self._lock = threading.Lock()
+
+    def record(self, span):
+        record = span.as_dict()
+        with self._lock:
+            self.histograms[span.name].add(span.duration_ms)
+            self.recent.append(record)
+        if self.exporter is not None:
+            self.exporter.export(record)
+
+    def close(self):
+        if self.exporter is not None:
+            self.exporter.close()
+
+    def summary(self):
+        with self._lock:
+            return {name: histogram.summary() for name, histogram in sorted(self.histograms.items())}
+
+    def recent_spans(self, n=50):
+        with self._lock:
+            return list(self.recent)[-n:]
+
+tracer = Tracer()
+atexit.register(tracer.close)
+
+@contextmanager
+def span(name, **attributes):
+    current = Span(name, _current_span.get(), attributes)
+    token = _current_span.set(current)
+    start = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        current.error = type(e).__name__
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        current.duration_ms = seconds * 1000
+        try:
+            _current_span.reset(token)
+        except ValueError:
+            # A generator closed from another context
+            pass
+        collector = _collector.get()
+        if collector is not None:
+            collector.add(name, seconds)
+        tracer.record(current)
+
+def current_span():
+    return _current_span.get()
+
+@contextmanager
+def stage(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        collector = _collector.get()
+        if collector is not None:
+            collector.add(name, time.perf_counter() - start)
+
+@contextmanager
+def collect_stages():
+    collector = StageTimings()
+    token = _collector.set(collector)
+    try:
+        yield collector
+    finally:
+        _collector.reset(token)
+
+def submit_in_context(executor, fn, *args, **kwargs):
+    return executor.submit(copy_context().run, fn, *args, **kwargs)